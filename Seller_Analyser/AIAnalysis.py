@@ -1,7 +1,13 @@
 CSV_PATH = "test.csv"
 
-# Import fuzz for fuzzy matching
-from fuzzywuzzy import fuzz
+# Compiled keyword engine for the rule-based matcher
+from KeywordMatcher import KeywordMatcher, ScanResult
+# Persistent per-comment classification cache
+from ClassificationCache import ClassificationCache
+# Columnar (Parquet) output for the tagged tables
+from TaggedParquet import TaggedWriter, parquet_path, write_tagged
+# Lazily built process-wide models and stores
+from SharedResources import lazy_singleton
 
 # Define hard negative issues
 HARD_NEGATIVE_ISSUES = {
@@ -14,7 +20,18 @@ import os
 import sys
 import pandas as pd
 import re
-from transformers import pipeline
+import numpy as np
+import json
+import hashlib
+import threading
+import multiprocessing as mp
+from collections import Counter
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
+
+# "parquet" writes test.parquet/negative_reviews.parquet (issues as a list column) instead of CSVs
+OUTPUT_FORMATS = ("csv", "parquet")
+OUTPUT_FORMAT = os.getenv("OUTPUT_FORMAT", "csv")
 
 # === Safe print for Unicode ===
 def safe_print(*args, **kwargs):
@@ -43,59 +60,230 @@ POSITIVE_WORDS = {
 
 
 
+# curly quotes/dashes -> ASCII, applied column-wide with str.translate
+QUOTE_TABLE = str.maketrans({"“": "\"", "”": "\"", "’": "'", "‘": "'", "–": "-", "—": "-"})
+STOCK_COMMENTS = {"ok","fine","good","meh","nice","cool"}
+
+def prepare_feedback(df: pd.DataFrame) -> pd.DataFrame:
+    """Normalize the comment column and drop short stock comments, all as column operations."""
+    req = {"comment","rating_type"}
+    if not req.issubset(df.columns):
+        raise ValueError(f"CSV must include {req}")
+    df = df.copy()
+    df["comment"] = df["comment"].fillna("").astype(str).str.translate(QUOTE_TABLE)
+    return df[~df["comment"].str.strip().str.lower().isin(STOCK_COMMENTS)].copy()
+
+def classify_frame(df: pd.DataFrame, batch_size=None, use_cache=True, cascade_band=None,
+                   workers=1) -> pd.DataFrame:
+    """Add issues/final_sentiment/tier columns to a prepared feedback frame."""
+    comments = df["comment"].str.strip()
+    ratings = df["rating_type"].fillna("").astype(str).str.strip()
+
+    # cached rows first; repeats of the same uncached comment are classified once
+    results = [None] * len(comments)
+    tiers = ["cache"] * len(comments)
+    todo = list(range(len(comments)))
+    cache = get_cache() if use_cache else None
+    if cache:
+        variant = fallback_variant() + ":" + ZSC_BACKEND + (f":cascade:{EMBED_MODEL}:{cascade_band[0]}-{cascade_band[1]}" if cascade_band else "")
+        keys = [cache.key(c, r, variant) for c, r in zip(comments, ratings)]
+        cached = cache.get_many(keys)
+        results = [cached.get(k) for k in keys]
+        first_miss = {}
+        for i, k in enumerate(keys):
+            if results[i] is None:
+                first_miss.setdefault(k, i)
+        todo = list(first_miss.values())
+
+    todo_results, todo_tiers = classify_comments(comments.iloc[todo], ratings.iloc[todo], batch_size=batch_size,
+                                                 cascade_band=cascade_band, workers=workers)
+    for i, res, tier in zip(todo, todo_results, todo_tiers):
+        results[i], tiers[i] = res, tier
+    if cache:
+        computed = {keys[i]: results[i] for i in todo}
+        cache.put_many(computed)
+        # in-run repeats share the result and tier of their first occurrence
+        first_tier = {keys[i]: tiers[i] for i in todo}
+        for i, k in enumerate(keys):
+            if results[i] is None:
+                results[i], tiers[i] = computed[k], first_tier[k]
+
+    df = df.copy()
+    df["issues"] = [r[0] for r in results]
+    df["final_sentiment"] = [r[1] for r in results]
+    df["tier"] = tiers
+    return df
+
+def analyze_csv(csv_path=CSV_PATH, batch_size=None, neg_path="negative_reviews.csv", use_cache=True,
+                cascade_band=None, workers=1, fmt=None):
+    """
+    Tag csv_path in place with issues/final_sentiment and export the NEGATIVE rows to neg_path.
+    Returns (df, summary, neg) so callers like the API can reuse the results without re-reading files.
+    With use_cache, comments already classified under the current rules/model skip rules and BART.
+    With cascade_band=(low, high), only comments the rules and MiniLM can't settle reach BART.
+    The tier that resolved each row is in the returned df's "tier" column; it is a per-run detail
+    (a re-run resolves every row from the cache), so it is never written to the output tables.
+    workers > 1 shards the keyword rule pass across a process pool.
+    fmt="parquet" leaves csv_path alone and writes both tables next to it as .parquet instead.
+    """
+    # ========= Load =========
+    if not os.path.exists(csv_path):
+        raise FileNotFoundError(os.path.abspath(csv_path))
+    df = prepare_feedback(pd.read_csv(csv_path))
+    df = classify_frame(df, batch_size=batch_size, use_cache=use_cache, cascade_band=cascade_band,
+                        workers=workers)
+    summary = summary_frame(issue_sentiment_counts(df))
+    table = df.drop(columns="tier")
+
+    # ========= Output =========
+    if (fmt or OUTPUT_FORMAT) == "parquet":
+        neg = table[table["final_sentiment"]=="NEGATIVE"]
+        write_tagged(table, parquet_path(csv_path))
+        write_tagged(neg, parquet_path(neg_path))
+        return df, summary, neg
+    # Save the DataFrame with issues/final_sentiment columns to test.csv for API/frontend
+    table.to_csv(csv_path, index=False)
+    neg = negative_rows(table)
+    neg.to_csv(neg_path, index=False)
+    return df, summary, neg
+
+def issue_sentiment_counts(df: pd.DataFrame) -> Counter:
+    """Row counts per (issue, final_sentiment); rows without issues are not counted."""
+    return Counter(df.explode("issues").groupby(["issues","final_sentiment"]).size().to_dict())
+
+def summary_frame(counts: Counter) -> pd.DataFrame:
+    rows = [(issue, sentiment, n) for (issue, sentiment), n in counts.items()]
+    return (pd.DataFrame(rows, columns=["issues","final_sentiment","count"])
+            .sort_values("count", ascending=False, kind="stable"))
+
+def negative_rows(df: pd.DataFrame) -> pd.DataFrame:
+    neg = df[df["final_sentiment"]=="NEGATIVE"].copy()
+    neg["issues"] = neg["issues"].apply(lambda x: ", ".join(x) if isinstance(x, list) else str(x))
+    return neg
+
+def analyze_csv_chunked(csv_path=CSV_PATH, chunk_size=50_000, batch_size=None, neg_path="negative_reviews.csv",
+                        use_cache=True, cascade_band=None, workers=1, fmt=None) -> dict:
+    """
+    Streaming form of analyze_csv for inputs too large to hold in memory. Reads chunk_size rows at
+    a time, classifies them, appends them to the output and negatives files, and folds the issue,
+    sentiment and tier counts into running totals. Memory is bounded by the chunk size.
+    The tagged rows replace csv_path (and the negatives neg_path) once every chunk is written; nothing
+    is left behind if a chunk fails. With fmt="parquet" each chunk is a row group of the .parquet
+    files instead.
+    """
+    if not os.path.exists(csv_path):
+        raise FileNotFoundError(os.path.abspath(csv_path))
+    tmp_path, neg_tmp_path = csv_path + ".partial", neg_path + ".partial"
+    parquet = (fmt or OUTPUT_FORMAT) == "parquet"
+    counts, sentiments, tiers = Counter(), Counter(), Counter()
+    rows = negatives = 0
+
+    with ExitStack() as stack:
+        if parquet:
+            tagged_out = stack.enter_context(TaggedWriter(parquet_path(csv_path)))
+            neg_out = stack.enter_context(TaggedWriter(parquet_path(neg_path)))
+        try:
+            for n, chunk in enumerate(pd.read_csv(csv_path, chunksize=chunk_size)):
+                df = classify_frame(prepare_feedback(chunk), batch_size=batch_size, use_cache=use_cache,
+                                    cascade_band=cascade_band, workers=workers)
+                tiers.update(df.pop("tier").tolist())
+                if parquet:
+                    neg = df[df["final_sentiment"]=="NEGATIVE"]
+                    tagged_out.write(df)
+                    neg_out.write(neg)
+                else:
+                    df.to_csv(tmp_path, mode="w" if n == 0 else "a", header=n == 0, index=False)
+                    neg = negative_rows(df)
+                    neg.to_csv(neg_tmp_path, mode="w" if n == 0 else "a", header=n == 0, index=False)
+
+                counts.update(issue_sentiment_counts(df))
+                sentiments.update(df["final_sentiment"].tolist())
+                rows += len(df)
+                negatives += len(neg)
+                safe_print(f"📦 Chunk {n + 1}: {rows} rows classified")
+        except BaseException:
+            # the inputs stay as they were; don't leave half-written CSVs next to them
+            for path in (tmp_path, neg_tmp_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+
+    if not parquet and os.path.exists(tmp_path):
+        os.replace(neg_tmp_path, neg_path)
+        os.replace(tmp_path, csv_path)
+    return {
+        "rows": rows,
+        "negatives": negatives,
+        "summary": summary_frame(counts),
+        "sentiments": pd.Series(sentiments, dtype="int64"),
+        "tiers": pd.Series(tiers, dtype="int64"),
+    }
+
 def main():
+    global ZSC_BACKEND, FALLBACK, OUTPUT_FORMAT
+    import argparse
+    parser = argparse.ArgumentParser(description="Tag eBay feedback with issues and final sentiment")
+    parser.add_argument("--batch-size", type=int, default=ZSC_BATCH_SIZE,
+                        help="comments per zero-shot forward pass")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="classify every comment instead of reusing the on-disk cache")
+    parser.add_argument("--cascade", action="store_true",
+                        help="resolve comments with rules/MiniLM first and only send ambiguous ones to BART")
+    parser.add_argument("--band", type=float, nargs=2, default=EMBED_BAND, metavar=("LOW", "HIGH"),
+                        help="MiniLM top-score uncertainty band that escalates to BART")
+    parser.add_argument("--backend", choices=ZSC_BACKENDS, default=ZSC_BACKEND,
+                        help="zero-shot inference backend (fp32 torch, int8 quantized or ONNX Runtime)")
+    parser.add_argument("--fallback", choices=FALLBACKS, default=FALLBACK,
+                        help="labels past the rules from BART zero-shot or the distilled classifier")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes for the keyword rule pass (1 = run in this process)")
+    parser.add_argument("--chunksize", type=int, default=0,
+                        help="stream the CSV in chunks of this many rows (0 = load it all at once)")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default=OUTPUT_FORMAT,
+                        help="write the tagged tables as CSV or as Parquet with a list issues column")
+    parser.add_argument("--parity", action="store_true",
+                        help="compare --backend labels against fp32 torch on the CSV and exit")
+    args = parser.parse_args()
+    ZSC_BACKEND = args.backend
+    FALLBACK = args.fallback
+    OUTPUT_FORMAT = args.format
+    if args.parity:
+        safe_print(f"⚖️ Backend parity vs fp32: {parity_check(CSV_PATH, args.backend, args.batch_size)}")
+        return
     try:
-        # ========= Load =========
-        if not os.path.exists(CSV_PATH):
-            raise FileNotFoundError(os.path.abspath(CSV_PATH))
-        df = pd.read_csv(CSV_PATH)
-        req = {"comment","rating_type"}
-        if not req.issubset(df.columns):
-            raise ValueError(f"CSV must include {req}")
-
-        def normalize_quotes(s: str) -> str:
-            return (s.replace("“","\"").replace("”","\"")
-                     .replace("’","'").replace("‘","'")
-                     .replace("–","-").replace("—","-"))
-
-        df["comment"] = df["comment"].fillna("").astype(str).map(normalize_quotes)
-        df = df[~df["comment"].str.strip().str.lower().isin({"ok","fine","good","meh","nice","cool"})].copy()
-
-        # ========= Categories / Keywords =========
-        # ...existing code...
-
-        # ========= Helpers =========
-        # ...existing code...
-
-        # zero-shot fallback (multi-label)
-        zsc = pipeline("zero-shot-classification", model="facebook/bart-large-mnli")
-
-        # ...existing code...
-
-
-        df[["issues", "final_sentiment"]] = df.apply(apply_row, axis=1)
-        # Save the DataFrame with issues/final_sentiment columns to test.csv for API/frontend
-        df.to_csv(CSV_PATH, index=False)
-
-        summary = (
-            df.explode("issues")
-            .groupby(["issues","final_sentiment"])
-            .size()
-            .reset_index(name="count")
-            .sort_values("count", ascending=False)
-        )
+        out_path = os.path.abspath("negative_reviews.csv")
+        saved_path = parquet_path(out_path) if OUTPUT_FORMAT == "parquet" else out_path
+        if args.chunksize:
+            result = analyze_csv_chunked(CSV_PATH, chunk_size=args.chunksize, batch_size=args.batch_size,
+                                         neg_path=out_path, use_cache=not args.no_cache,
+                                         cascade_band=tuple(args.band) if args.cascade else None,
+                                         workers=args.workers)
+            if not args.no_cache:
+                safe_print(f"🗄️ Classification cache: {get_cache().stats()}")
+            safe_print("🪜 Rows resolved per tier:")
+            safe_print((result["tiers"] / max(result["rows"], 1)).round(4).to_string())
+            safe_print("📊 Issue Sentiment Summary:")
+            safe_print(result["summary"])
+            safe_print("\n🧮 Final sentiment counts:")
+            safe_print(result["sentiments"].to_string())
+            safe_print(f"\n💾 {result['negatives']} negative reviews exported to {saved_path}")
+            return
+
+        df, summary, neg = analyze_csv(CSV_PATH, batch_size=args.batch_size, neg_path=out_path,
+                                       use_cache=not args.no_cache,
+                                       cascade_band=tuple(args.band) if args.cascade else None,
+                                       workers=args.workers)
+        if not args.no_cache:
+            safe_print(f"🗄️ Classification cache: {get_cache().stats()}")
+        safe_print("🪜 Rows resolved per tier:")
+        safe_print(df["tier"].value_counts(normalize=True).round(4).to_string())
 
         safe_print("📊 Issue Sentiment Summary:")
         safe_print(summary)
 
         safe_print("\n🚨 All NEGATIVE Reviews:")
-        neg = df[df["final_sentiment"]=="NEGATIVE"].copy()
-        neg["issues"] = neg["issues"].apply(lambda x: ", ".join(x) if isinstance(x, list) else str(x))
         safe_print(neg[["comment","issues"]].to_string(index=False))
-
-        out_path = os.path.abspath("negative_reviews.csv")
-        neg.to_csv(out_path, index=False)
-        safe_print(f"\n💾 Negative reviews exported to {out_path}")
+        safe_print(f"\n💾 Negative reviews exported to {saved_path}")
     except Exception as e:
         import traceback
         safe_print(f"[AIAnalysis] ERROR: {e}")
@@ -144,90 +332,179 @@ ISSUE_KEYWORDS = {
 SEVERE_MODS = {"excessive","large","deep","pronounced","many","a lot","tons","way more","significant","big","heavy"}
 MINOR_MODS  = {"tiny","small","minor","light","hairline","couple","few","not visible","barely visible","only"}
 
-# ========= Helpers =========
-def has_negation_window(text: str, kw: str, max_gap=3) -> bool:
-    """
-    Detect negation within a small window before keyword.
-    Catches: 'no scratches', 'not scratched', 'never any scratches', 'without scratches'
-    """
-    pattern = rf"\b(?:no|not|never|without)\b(?:\W+\w+){{0,{max_gap}}}?\W*\b{re.escape(kw)}\b"
-    return re.search(pattern, text, flags=re.IGNORECASE) is not None
+# one compiled matcher for every keyword table, built once per process
+MATCHER = KeywordMatcher(ISSUE_KEYWORDS, SEVERE_MODS, MINOR_MODS, POSITIVE_WORDS, threshold=95)
 
-def fuzzy_hit(text: str, kw: str, threshold=95) -> bool:
-    return fuzz.partial_ratio(kw, text) >= threshold
-
-def detect_damage_with_severity(text: str, original_rating: str) -> str | None:
-    t = text.lower()
-    any_damage_word = False
-    severe_hint = False
-    minor_hint = False
+MISLEADING_RE = re.compile(r"\bmisleading\b|\bnot as described\b|\bdescription (?:not|isn't|isn’t) accurate\b")
 
-    for kw in ISSUE_KEYWORDS["Damaged product"]:
-        if has_negation_window(t, kw):  # e.g., "no scratches"
-            continue
-        if fuzzy_hit(t, kw):
-            any_damage_word = True
+# ========= Helpers =========
+def detect_damage_with_severity(text: str, original_rating: str, scan: ScanResult | None = None) -> str | None:
+    scan = scan or MATCHER.scan(text)
 
-    if not any_damage_word:
+    # any non-negated damage keyword, e.g. "no scratches" doesn't count
+    if "Damaged product" not in scan.issues:
         return None
 
-    # severity cues
-    for mod in SEVERE_MODS:
-        if mod in t:
-            severe_hint = True; break
-    for mod in MINOR_MODS:
-        if mod in t:
-            minor_hint = True
-
-    # cracked/shattered are always severe
-    if any(w in t for w in ["crack","cracked","shatter","shattered","chip","chipped"]):
-        severe_hint = True
-
     # if user rated Positive and damage is minor → don't tag as damage
-    if original_rating.lower() == "positive" and not severe_hint:
+    if original_rating.lower() == "positive" and not scan.severe:
         return None
 
-    return "Damaged product (severe)" if severe_hint else "Damaged product"
+    return "Damaged product (severe)" if scan.severe else "Damaged product"
 
-def match_issues_rule_based(text: str, original_rating: str, threshold=95) -> list[str]:
+def match_issues_rule_based(text: str, original_rating: str, scan: ScanResult | None = None) -> list[str]:
     t = text.lower()
-    issues = set()
+    scan = scan or MATCHER.scan(text)
 
-    # Special-case damage with severity
-    dmg = detect_damage_with_severity(text, original_rating)
+    # Generic keyword matching with negation guard; damage is special-cased with severity
+    issues = scan.issues - {"Damaged product"}
+    dmg = detect_damage_with_severity(text, original_rating, scan)
     if dmg:
         issues.add(dmg)
 
-    # Generic keyword matching with negation guard
-    for issue, kws in ISSUE_KEYWORDS.items():
-        if issue.startswith("Damaged product"):
-            continue  # handled above
-        for kw in kws:
-            if has_negation_window(t, kw):
-                continue
-            if fuzzy_hit(t, kw, threshold=threshold):
-                issues.add(issue); break
-
     # Conflict cleanup: Accurate vs Misleading
     if "Accurate description" in issues and "Misleading description" in issues:
-        if re.search(r"\bmisleading\b|\bnot as described\b|\bdescription (?:not|isn't|isn’t) accurate\b", t):
+        if MISLEADING_RE.search(t):
             issues.discard("Accurate description")
         else:
             issues.discard("Misleading description")
 
     # If positive wording is strong, prefer positive product tags
-    if any(pw in t for pw in POSITIVE_WORDS):
+    if scan.positive:
         issues.add("Good product")
 
     return sorted(issues)
 
 # zero-shot fallback (multi-label)
-zsc = pipeline("zero-shot-classification", model="facebook/bart-large-mnli")
-
-def ai_fallback(text: str, min_conf=0.70, topk=3) -> list[str]:
-    if not text.strip():
-        return []
-    res = zsc(text, ISSUE_CATEGORIES, multi_label=True)
+ZSC_MODEL = "facebook/bart-large-mnli"
+# comments per zero-shot forward; each comment expands to one NLI pair per category
+ZSC_BATCH_SIZE = 8
+
+# inference backend: "torch" (fp32), "int8" (dynamic quantization) or "onnx" (ONNX Runtime)
+ZSC_BACKENDS = ("torch", "int8", "onnx")
+ZSC_BACKEND = os.getenv("ZSC_BACKEND", "torch")
+ONNX_DIR = "data/onnx/bart-large-mnli"
+
+# shared pipelines per backend, loaded on the first real fallback request (at most once per process)
+_zsc = {}
+_zsc_lock = threading.Lock()
+
+def load_zsc(backend: str):
+    from transformers import pipeline, AutoTokenizer
+    if backend == "torch":
+        return pipeline("zero-shot-classification", model=ZSC_MODEL)
+
+    tokenizer = AutoTokenizer.from_pretrained(ZSC_MODEL)
+    if backend == "int8":
+        import torch
+        from transformers import AutoModelForSequenceClassification
+        model = AutoModelForSequenceClassification.from_pretrained(ZSC_MODEL)
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif backend == "onnx":
+        from optimum.onnxruntime import ORTModelForSequenceClassification
+        if os.path.isdir(ONNX_DIR):
+            model = ORTModelForSequenceClassification.from_pretrained(ONNX_DIR)
+        else:
+            # one-off export, reused by later runs
+            model = ORTModelForSequenceClassification.from_pretrained(ZSC_MODEL, export=True)
+            model.save_pretrained(ONNX_DIR)
+    else:
+        raise ValueError(f"Unknown zero-shot backend {backend!r}, expected one of {ZSC_BACKENDS}")
+    return pipeline("zero-shot-classification", model=model, tokenizer=tokenizer)
+
+def get_zsc(backend: str | None = None):
+    backend = backend or ZSC_BACKEND
+    if backend not in _zsc:
+        with _zsc_lock:
+            if backend not in _zsc:
+                safe_print(f"[AIAnalysis] Loading zero-shot model {ZSC_MODEL} ({backend})...")
+                _zsc[backend] = load_zsc(backend)
+    return _zsc[backend]
+
+def warm_up():
+    """Load the zero-shot model ahead of the first request, for long-running servers."""
+    get_zsc()
+
+def parity_check(csv_path=CSV_PATH, backend="int8", batch_size=ZSC_BATCH_SIZE) -> dict:
+    """
+    Compare fallback labels from backend against the fp32 torch model on csv_path's comments.
+    Reports exact label-set agreement, mean Jaccard overlap and seconds per comment for both.
+    """
+    import time
+    comments = [c for c in pd.read_csv(csv_path)["comment"].fillna("").astype(str).str.strip() if c]
+    timings = {}
+    labels = {}
+    for name in ("torch", backend):
+        get_zsc(name)  # load outside the timed section
+        start = time.perf_counter()
+        labels[name] = ai_fallback_batch(comments, batch_size=batch_size, backend=name)
+        timings[name] = (time.perf_counter() - start) / max(len(comments), 1)
+
+    exact = 0
+    jaccard = 0.0
+    for ref, got in zip(labels["torch"], labels[backend]):
+        ref, got = set(ref), set(got)
+        exact += ref == got
+        jaccard += len(ref & got) / len(ref | got) if ref | got else 1.0
+    n = max(len(comments), 1)
+    return {
+        "backend": backend,
+        "comments": len(comments),
+        "exact_agreement": round(exact / n, 4),
+        "mean_jaccard": round(jaccard / n, 4),
+        "sec_per_comment_torch": round(timings["torch"], 4),
+        f"sec_per_comment_{backend}": round(timings[backend], 4),
+    }
+
+# ========= Embedding pre-filter (cascade) =========
+EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# top cosine score below LOW -> no AI labels, above HIGH -> MiniLM labels, in between -> escalate to BART
+EMBED_BAND = (0.30, 0.55)
+
+@lazy_singleton
+def get_embedder():
+    """MiniLM model plus the precomputed ISSUE_CATEGORIES embeddings, loaded on first use."""
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(EMBED_MODEL)
+    return model, model.encode(ISSUE_CATEGORIES, convert_to_tensor=True, normalize_embeddings=True)
+
+def embedding_labels(texts: list[str], band=EMBED_BAND, topk=3) -> tuple[list[list[str]], list[bool]]:
+    """
+    Score comments against the category embeddings. Returns (labels, escalate) per comment;
+    escalate is True when the top score falls inside the band and BART should decide.
+    """
+    if not texts:
+        return [], []
+    model, cat_emb = get_embedder()
+    emb = model.encode(texts, batch_size=64, convert_to_tensor=True, normalize_embeddings=True)
+    scores = emb @ cat_emb.T
+    top_scores, top_idx = scores.topk(min(topk, len(ISSUE_CATEGORIES)), dim=1)
+    low, high = band
+    labels, escalate = [], []
+    for row_scores, row_idx in zip(top_scores.tolist(), top_idx.tolist()):
+        if low <= row_scores[0] < high:
+            labels.append([])
+            escalate.append(True)
+        else:
+            labels.append([ISSUE_CATEGORIES[j] for sc, j in zip(row_scores, row_idx) if sc >= high])
+            escalate.append(False)
+    return labels, escalate
+
+# ========= Classification cache =========
+CACHE_PATH = "data/classification_cache.sqlite"
+CACHE_MAX_ENTRIES = 500_000
+# bump when classification logic changes without touching the tables below
+RULES_VERSION = 1
+
+def cache_version() -> str:
+    tables = [RULES_VERSION, ZSC_MODEL, ISSUE_CATEGORIES, ISSUE_KEYWORDS, sorted(SEVERE_MODS), sorted(MINOR_MODS),
+              sorted(POSITIVE_WORDS), sorted(HARD_NEGATIVE_ISSUES), sorted(POSITIVE_ISSUES)]
+    return hashlib.sha1(json.dumps(tables, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+@lazy_singleton
+def get_cache() -> ClassificationCache:
+    return ClassificationCache(CACHE_PATH, cache_version(), max_entries=CACHE_MAX_ENTRIES)
+
+def top_labels(res: dict, min_conf=0.70, topk=3) -> list[str]:
     labels = []
     for lbl, score in zip(res["labels"], res["scores"]):
         if score >= min_conf:
@@ -236,13 +513,54 @@ def ai_fallback(text: str, min_conf=0.70, topk=3) -> list[str]:
             break
     return labels
 
-def finalize_issues(text: str, original_rating: str) -> list[str]:
-    rb = set(match_issues_rule_based(text, original_rating))
-    if not rb:
-        ai = set(ai_fallback(text))
-    else:
-        # Only let AI add *non-contradictory* extras
-        ai = set(ai_fallback(text)) - {"Misleading description"} if "Accurate description" in rb else set(ai_fallback(text))
+def ai_fallback(text: str, min_conf=0.70, topk=3, backend: str | None = None) -> list[str]:
+    if not text.strip():
+        return []
+    res = get_zsc(backend)(text, ISSUE_CATEGORIES, multi_label=True)
+    return top_labels(res, min_conf, topk)
+
+def ai_fallback_batch(texts: list[str], batch_size=ZSC_BATCH_SIZE, min_conf=0.70, topk=3,
+                      backend: str | None = None) -> list[list[str]]:
+    """
+    ai_fallback over many comments. Comments are sorted by length and sent in buckets of
+    batch_size so each forward pads to similar lengths; labels come back in input order.
+    """
+    labels = [[] for _ in texts]
+    order = sorted((i for i, t in enumerate(texts) if t.strip()), key=lambda i: len(texts[i]))
+    for start in range(0, len(order), batch_size):
+        bucket = order[start:start + batch_size]
+        results = get_zsc(backend)([texts[i] for i in bucket], ISSUE_CATEGORIES, multi_label=True,
+                                   batch_size=batch_size * len(ISSUE_CATEGORIES))
+        for i, res in zip(bucket, results):
+            labels[i] = top_labels(res, min_conf, topk)
+    return labels
+
+# which model fills in labels past the rules: "bart" (zero-shot) or "distilled" (DistilledClassifier.py)
+FALLBACKS = ("bart", "distilled")
+FALLBACK = os.getenv("AI_FALLBACK", "bart")
+
+def fallback_batch(texts: list[str], batch_size=None) -> list[list[str]]:
+    if FALLBACK == "distilled":
+        from DistilledClassifier import distilled_fallback_batch
+        return distilled_fallback_batch(texts)
+    return ai_fallback_batch(texts, batch_size=batch_size or ZSC_BATCH_SIZE)
+
+def fallback_variant() -> str:
+    """Cache-key part naming the fallback; the distilled one includes its model hash, so retraining it
+    doesn't serve labels the previous model produced."""
+    if FALLBACK == "distilled":
+        from DistilledClassifier import MODEL_PATH, model_version
+        if os.path.exists(MODEL_PATH):
+            return f"distilled@{model_version(MODEL_PATH)}"
+    return FALLBACK
+
+def finalize_issues(text: str, original_rating: str, scan: ScanResult | None = None,
+                    ai_labels: list[str] | None = None) -> list[str]:
+    rb = set(match_issues_rule_based(text, original_rating, scan))
+    ai = set(fallback_batch([text])[0] if ai_labels is None else ai_labels)
+    # Only let AI add *non-contradictory* extras
+    if "Accurate description" in rb:
+        ai.discard("Misleading description")
     issues = rb | ai
 
     # If “Damaged product (severe)” and “Damaged product” both present → keep severe only
@@ -259,11 +577,10 @@ def finalize_issues(text: str, original_rating: str) -> list[str]:
 
     return sorted(issues)
 
-def override_sentiment(comment: str, issues: list[str], rating_type: str) -> str:
-    t = comment.lower()
+def override_sentiment(comment: str, issues: list[str], rating_type: str, scan: ScanResult | None = None) -> str:
     has_hard_neg = any(i in HARD_NEGATIVE_ISSUES for i in issues)
     has_pos_issue = any(i in POSITIVE_ISSUES for i in issues)
-    has_pos_words = any(pw in t for pw in POSITIVE_WORDS)
+    has_pos_words = (scan or MATCHER.scan(comment)).positive
 
     # Late delivery alone shouldn't flip a positive rating
     only_late = issues == ["Late delivery"] or set(issues) == {"Late delivery"}
@@ -290,45 +607,170 @@ def override_sentiment(comment: str, issues: list[str], rating_type: str) -> str
 
     return rating_type.upper()
 
-# ========= Apply =========
-def apply_row(row):
-    comment = (row["comment"] or "").strip()
-    rating = (row["rating_type"] or "").strip()
-    if not comment:
-        return pd.Series([[], rating.upper() or "NEUTRAL"])
-    issues = finalize_issues(comment, rating)
-    sentiment = override_sentiment(comment, issues, rating)
-    return pd.Series([issues, sentiment])
-
+# ========= Parallel rule pass =========
+# below this many comments the pool's IPC costs more than it saves
+PARALLEL_MIN_ROWS = 2000
+
+_rule_pool = None
+_rule_pool_workers = 0
+_rule_pool_lock = threading.Lock()
+_worker_matcher = None
+
+def _init_rule_worker(issue_keywords, severe_mods, minor_mods, positive_words):
+    # compile the keyword tables once per worker process
+    global _worker_matcher
+    _worker_matcher = KeywordMatcher(issue_keywords, severe_mods, minor_mods, positive_words, threshold=95)
+
+def _scan_shard(texts: list[str]) -> list[ScanResult]:
+    return [_worker_matcher.scan(t) for t in texts]
+
+def get_rule_pool(workers: int) -> ProcessPoolExecutor:
+    """Long-lived pool of initialized rule workers, recreated only if the worker count changes."""
+    global _rule_pool, _rule_pool_workers
+    with _rule_pool_lock:
+        if _rule_pool is None or _rule_pool_workers != workers:
+            if _rule_pool is not None:
+                _rule_pool.shutdown()
+            # spawn, not fork: the API process holds threads, the zero-shot model and SQLite handles
+            _rule_pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=mp.get_context("spawn"), initializer=_init_rule_worker,
+                initargs=(ISSUE_KEYWORDS, SEVERE_MODS, MINOR_MODS, POSITIVE_WORDS),
+            )
+            _rule_pool_workers = workers
+    return _rule_pool
+
+def scan_comments(texts: list[str], workers=1) -> list[ScanResult]:
+    """MATCHER.scan over many comments, sharded across worker processes and reassembled in order."""
+    if workers <= 1 or len(texts) < PARALLEL_MIN_ROWS:
+        return [MATCHER.scan(t) for t in texts]
+    shard_size = -(-len(texts) // (workers * 4))  # a few shards per worker evens out long comments
+    shards = [texts[i:i + shard_size] for i in range(0, len(texts), shard_size)]
+    return [scan for shard in get_rule_pool(workers).map(_scan_shard, shards) for scan in shard]
 
+# ========= Apply =========
+# one boolean column per issue; sorted so a row's flags read back as a sorted issue list
+ISSUE_COLUMNS = sorted(set(ISSUE_CATEGORIES) | {"Damaged product (severe)"})
+MISLEADING_AI_RE = re.compile(r"\bmisleading\b|\bnot as described\b")
+
+def issue_flags(label_sets, index) -> pd.DataFrame:
+    """Boolean issue matrix (rows x ISSUE_COLUMNS) from per-row label collections."""
+    col = {c: j for j, c in enumerate(ISSUE_COLUMNS)}
+    rows, cols = [], []
+    for i, labels in enumerate(label_sets):
+        for lbl in labels:
+            rows.append(i)
+            cols.append(col[lbl])
+    flags = np.zeros((len(index), len(ISSUE_COLUMNS)), dtype=bool)
+    flags[rows, cols] = True
+    return pd.DataFrame(flags, index=index, columns=ISSUE_COLUMNS)
+
+def rule_flags(lower: pd.Series, ratings: pd.Series, scans: list[ScanResult]) -> pd.DataFrame:
+    """match_issues_rule_based over a whole column: keyword hits, damage severity, conflicts, positives."""
+    flags = issue_flags([scan.issues for scan in scans], lower.index)
+    severe = pd.Series([scan.severe for scan in scans], index=lower.index)
+    positive = pd.Series([scan.positive for scan in scans], index=lower.index)
+
+    # damage with severity; minor damage on a Positive rating isn't tagged
+    damaged = flags["Damaged product"] & ~((ratings.str.lower() == "positive") & ~severe)
+    flags["Damaged product (severe)"] = damaged & severe
+    flags["Damaged product"] = damaged & ~severe
 
-    try:
-        df[["issues", "final_sentiment"]] = df.apply(apply_row, axis=1)
-
-        # ========= Output =========
-        summary = (
-            df.explode("issues")
-            .groupby(["issues","final_sentiment"])
-            .size()
-            .reset_index(name="count")
-            .sort_values("count", ascending=False)
-        )
-
-        safe_print("📊 Issue Sentiment Summary:")
-        safe_print(summary)
+    # Conflict cleanup: Accurate vs Misleading
+    both = flags["Accurate description"] & flags["Misleading description"]
+    misleading = lower.str.contains(MISLEADING_RE)
+    flags.loc[both & misleading, "Accurate description"] = False
+    flags.loc[both & ~misleading, "Misleading description"] = False
 
-        safe_print("\n🚨 All NEGATIVE Reviews:")
-        neg = df[df["final_sentiment"]=="NEGATIVE"].copy()
-        neg["issues"] = neg["issues"].apply(lambda x: ", ".join(x) if isinstance(x, list) else str(x))
-        safe_print(neg[["comment","issues"]].to_string(index=False))
+    # If positive wording is strong, prefer positive product tags
+    flags["Good product"] |= positive
+    return flags
+
+def sentiment_from_flags(flags: pd.DataFrame, ratings: pd.Series, positive: pd.Series) -> pd.Series:
+    """override_sentiment as boolean masks over the issue flags."""
+    rating = ratings.str.lower()
+    has_hard_neg = flags[sorted(HARD_NEGATIVE_ISSUES)].any(axis=1)
+    has_pos_issue = flags[sorted(POSITIVE_ISSUES)].any(axis=1)
+    only_late = flags["Late delivery"] & (flags.sum(axis=1) == 1)
+    original = ratings.str.upper()
+    return pd.Series(np.select(
+        [
+            (rating == "positive") & ~has_hard_neg,      # positive rating, no hard negative
+            positive & ~has_hard_neg,                    # strong positive wording, no hard negative
+            only_late & (rating != "negative"),          # late delivery alone keeps the original
+            has_hard_neg,
+            has_pos_issue & (rating != "negative"),
+        ],
+        ["POSITIVE", "POSITIVE", original, "NEGATIVE", "POSITIVE"],
+        default=original,
+    ), index=flags.index)
+
+def classify_comments(comments: pd.Series, ratings: pd.Series, batch_size=None, cascade_band=None,
+                      workers=1) -> tuple[list[tuple[list[str], str]], list[str]]:
+    """
+    Classify a column of comments. Returns ([(issues, sentiment)], [tier]) in input order, where tier
+    is the cheapest stage that settled the comment: "rules", "embedding" or the fallback ("bart"/"distilled").
+    Without a cascade every comment gets BART labels on top of the rules, as before.
+    """
+    comments = comments.reset_index(drop=True)
+    ratings = ratings.reset_index(drop=True)
+    lower = comments.str.lower()
+    scans = scan_comments(lower.tolist(), workers)
+    positive = pd.Series([scan.positive for scan in scans], index=comments.index)
+    rules = rule_flags(lower, ratings, scans)
+
+    nonempty = comments.str.len() > 0
+    tiers = pd.Series(np.where(nonempty, FALLBACK, "rules"), index=comments.index, dtype=object)
+    ai_labels = pd.Series([[] for _ in comments], index=comments.index, dtype=object)
+    pending = nonempty
+
+    if cascade_band:
+        rule_hit = pending & rules.any(axis=1)
+        tiers[rule_hit] = "rules"
+        pending = pending & ~rule_hit
+        idx = pending[pending].index
+        emb_labels, escalate = embedding_labels(comments[idx].tolist(), band=cascade_band)
+        escalate = pd.Series(escalate, index=idx, dtype=bool)
+        settled = escalate[~escalate].index
+        ai_labels[settled] = pd.Series(emb_labels, index=idx, dtype=object)[settled]
+        tiers[settled] = "embedding"
+        pending = pd.Series(False, index=comments.index)
+        pending[escalate[escalate].index] = True
+
+    # zero-shot labels for the rest in length-sorted batches, then merge back per row
+    idx = pending[pending].index
+    ai_labels[idx] = pd.Series(fallback_batch(comments[idx].tolist(), batch_size=batch_size),
+                               index=idx, dtype=object)
+
+    # finalize_issues: AI adds non-contradictory extras on top of the rules
+    ai = issue_flags(ai_labels, comments.index)
+    ai["Misleading description"] &= ~rules["Accurate description"]
+    flags = rules | ai
+    # If “Damaged product (severe)” and “Damaged product” both present → keep severe only
+    flags["Damaged product"] &= ~flags["Damaged product (severe)"]
+    # Re-run description conflict in case AI added the other side
+    both = flags["Accurate description"] & flags["Misleading description"]
+    misleading = lower.str.contains(MISLEADING_AI_RE)
+    flags.loc[both & misleading, "Accurate description"] = False
+    flags.loc[both & ~misleading, "Misleading description"] = False
+
+    # empty comments carry no issues and keep their rating (NEUTRAL when missing)
+    flags.loc[~nonempty] = False
+    sentiment = sentiment_from_flags(flags, ratings, positive)
+    sentiment[~nonempty] = ratings[~nonempty].str.upper().replace("", "NEUTRAL")
+
+    columns = np.array(ISSUE_COLUMNS)
+    issues = [columns[row].tolist() for row in flags.to_numpy()]
+    return list(zip(issues, sentiment.tolist())), tiers.tolist()
+
+def classify_comment(comment: str, rating: str, ai_labels: list[str] | None = None,
+                     scan: ScanResult | None = None) -> tuple[list[str], str]:
+    """Single-comment form of classify_comments, handy for ad-hoc checks."""
+    if not comment:
+        return [], rating.upper() or "NEUTRAL"
+    scan = scan or MATCHER.scan(comment)
+    issues = finalize_issues(comment, rating, scan, ai_labels)
+    sentiment = override_sentiment(comment, issues, rating, scan)
+    return issues, sentiment
 
-        out_path = os.path.abspath("negative_reviews.csv")
-        neg.to_csv(out_path, index=False)
-        safe_print(f"\n💾 Negative reviews exported to {out_path}")
-    except Exception as e:
-        import traceback
-        safe_print(f"[AIAnalysis] ERROR: {e}")
-        safe_print(traceback.format_exc())
-        sys.exit(1)
 if __name__ == "__main__":
     main()
@@ -0,0 +1,81 @@
+import json
+import time
+from collections import defaultdict
+from selenium.webdriver.support.ui import WebDriverWait
+
+# Readiness-driven waits for the Selenium scrapers: each returns as soon as its condition holds
+# (DOM ready, URL change, feedback rows changed) and records how long it took under a step name in
+# the WaitTimings passed in, one per scrape, so concurrent or back-to-back scrapes never mix timings.
+WAIT_TIMEOUT = 20
+POLL = 0.1
+
+ROW_SIGNATURE_JS = """
+const rows = document.querySelectorAll("tr[data-feedback-id]");
+return [rows.length, rows.length ? rows[0].getAttribute("data-feedback-id") : null];
+"""
+
+
+class WaitTimings:
+    """Seconds spent per wait step; timeouts are recorded too, so slow pages show up in the summary."""
+
+    def __init__(self):
+        self.steps = defaultdict(list)
+        self.timeouts = defaultdict(int)
+
+    def record(self, step, seconds, timed_out=False):
+        self.steps[step].append(seconds)
+        if timed_out:
+            self.timeouts[step] += 1
+
+    def as_dict(self) -> dict:
+        return {
+            step: {"waits": len(s), "total_s": round(sum(s), 3), "max_s": round(max(s), 3),
+                   "timeouts": self.timeouts[step]}
+            for step, s in self.steps.items()
+        }
+
+    def summary(self) -> str:
+        return "\n".join(f"  {step}: {d['waits']}x, {d['total_s']}s total, {d['max_s']}s max"
+                         + (f", {d['timeouts']} timed out" if d["timeouts"] else "")
+                         for step, d in self.as_dict().items())
+
+    def dump(self, path, **extra):
+        """Append this run's timings as one JSON line, for comparing runs over time."""
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"time": time.strftime("%Y-%m-%dT%H:%M:%S"), **extra, "waits": self.as_dict()}) + "\n")
+
+
+def timed_wait(driver, step, condition, timeout=WAIT_TIMEOUT, timings=None):
+    """
+    WebDriverWait(...).until(condition) that records its duration under step in timings (when given);
+    re-raises TimeoutException.
+    """
+    start = time.perf_counter()
+    try:
+        result = WebDriverWait(driver, timeout, poll_frequency=POLL).until(condition)
+    except Exception:
+        if timings is not None:
+            timings.record(step, time.perf_counter() - start, timed_out=True)
+        raise
+    if timings is not None:
+        timings.record(step, time.perf_counter() - start)
+    return result
+
+def wait_for_dom_ready(driver, step="dom_ready", timeout=WAIT_TIMEOUT, timings=None):
+    return timed_wait(driver, step, lambda d: d.execute_script("return document.readyState") == "complete",
+                      timeout, timings)
+
+def wait_for_url(driver, predicate, step="url", timeout=WAIT_TIMEOUT, timings=None):
+    """Until predicate(current_url) holds, e.g. the CAPTCHA page has been left."""
+    return timed_wait(driver, step, lambda d: predicate(d.current_url), timeout, timings)
+
+def row_signature(driver):
+    """(row count, first feedback id) of the feedback table; changes whenever the table is replaced."""
+    return tuple(driver.execute_script(ROW_SIGNATURE_JS))
+
+def wait_for_rows(driver, step="rows", timeout=WAIT_TIMEOUT, timings=None):
+    return timed_wait(driver, step, lambda d: row_signature(d)[0] > 0, timeout, timings)
+
+def wait_for_rows_change(driver, before, step="rows_change", timeout=WAIT_TIMEOUT, timings=None):
+    """Until the table has rows and its signature differs from before (next page, page size change)."""
+    return timed_wait(driver, step, lambda d: (sig := row_signature(d))[0] > 0 and sig != before, timeout, timings)
@@ -0,0 +1,89 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from SharedResources import open_sqlite
+
+
+def normalize_comment(comment: str) -> str:
+    """Case- and whitespace-insensitive form of a comment, so repeats share one cache entry."""
+    return re.sub(r"\s+", " ", comment).strip().lower()
+
+
+class ClassificationCache:
+    """
+    On-disk cache of (issues, final_sentiment) per comment, backed by SQLite.
+    Entries are keyed by a hash of the normalized comment, rating type and a rules/model version,
+    so editing the keyword tables or swapping the model never serves stale labels.
+    The least recently used entries are evicted once the table grows past max_entries.
+    """
+
+    def __init__(self, path: str, version: str, max_entries=500_000):
+        self.path = path
+        self.version = version
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = open_sqlite(
+            path,
+            "CREATE TABLE IF NOT EXISTS classifications ("
+            " key TEXT PRIMARY KEY, issues TEXT NOT NULL, sentiment TEXT NOT NULL, last_used REAL NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS idx_last_used ON classifications(last_used)",
+        )
+
+    def key(self, comment: str, rating_type: str, variant: str = "") -> str:
+        """variant separates results produced under different pipeline settings (e.g. cascade bands)."""
+        raw = "\x1f".join([self.version, variant, (rating_type or "").strip().lower(), normalize_comment(comment)])
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: list[str]) -> dict:
+        """Return {key: (issues, sentiment)} for the keys present and bump their recency."""
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, issues, sentiment FROM classifications WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for k, issues, sentiment in rows:
+                    found[k] = (json.loads(issues), sentiment)
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE classifications SET last_used=? WHERE key=?",
+                                       [(now, k) for k in found])
+                self._conn.commit()
+            self.hits += sum(1 for k in keys if k in found)
+            self.misses += sum(1 for k in keys if k not in found)
+        return found
+
+    def put_many(self, items: dict):
+        """Store {key: (issues, sentiment)} and evict the least recently used overflow."""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO classifications (key, issues, sentiment, last_used) VALUES (?, ?, ?, ?)",
+                [(k, json.dumps(list(issues)), sentiment, now) for k, (issues, sentiment) in items.items()],
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM classifications").fetchone()
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM classifications WHERE key IN "
+                    "(SELECT key FROM classifications ORDER BY last_used ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,15 +1,35 @@
-from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.edge.service import Service
-from selenium.webdriver.edge.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import NoSuchElementException, TimeoutException
-from urllib.parse import urlparse, parse_qs, urlencode, urlunparse, quote
+from selenium.common.exceptions import TimeoutException
+import os
 import time
 import csv
+import json
 import sys
+import threading
+from contextlib import contextmanager
 from TranslateFeedback import load_language
+from FeedbackHttp import (BrowserRequired, CaptchaRequired, RateLimited, is_captcha_url, throttle, recent_feedback_url,
+                          scrape_feedback_pages, seller_from_feedback_url, until_seen)
+from BrowserWaits import (WaitTimings, timed_wait, wait_for_dom_ready, wait_for_url, row_signature, wait_for_rows,
+                          wait_for_rows_change)
+from DriverPool import create_driver, get_driver_pool
+from FeedbackArchive import get_archive
+from FeedbackResolver import get_resolver
+
+# safe_print lines are also collected here while the calling thread is inside capture_log()
+_log = threading.local()
+
+@contextmanager
+def capture_log():
+    """Collect the lines this thread safe_prints (they still reach the console), e.g. one API request's
+    scrape log; unlike redirecting sys.stdout this doesn't touch other threads' output."""
+    lines = []
+    _log.lines = lines
+    try:
+        yield lines
+    finally:
+        _log.lines = None
 
 # Unicode-safe print for Windows
 def safe_print(*args, **kwargs):
@@ -18,118 +38,276 @@ def safe_print(*args, **kwargs):
     except UnicodeEncodeError:
         enc = getattr(sys.stdout, 'encoding', 'utf-8')
         print(*(str(a).encode(enc, errors='replace').decode(enc) for a in args), **kwargs, file=sys.stdout, flush=True)
+    lines = getattr(_log, "lines", None)
+    if lines is not None:
+        lines.append(kwargs.get("sep", " ").join(str(a) for a in args))
+
+# how long a person gets to solve a CAPTCHA in the visible browser
+CAPTCHA_TIMEOUT = 600
+# where each run's per-step wait timings are appended
+TIMINGS_LOG = "scrape_timings.jsonl"
+# stop at the seller's last ingested feedback id and serve the rest from the archive (0 = full re-scrape)
+INCREMENTAL = os.getenv("SCRAPE_INCREMENTAL", "1") != "0"
+# with a high-water mark, paging goes on past max_rows up to this many rows to reach it, so a burst of
+# new feedback between runs doesn't leave a hole in the archive
+CATCHUP_ROWS = int(os.getenv("SCRAPE_CATCHUP_ROWS", "5000"))
 
-# -------- Setup Edge Options --------
-edge_driver_path = r"msedgedriver.exe"
-
-def create_driver(headless=True):
-    options = Options()
-    if headless:
-        options.add_argument("--headless=new")
-    options.add_argument("--disable-blink-features=AutomationControlled")
-    options.add_argument("--start-maximized")
-    options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36")
-    service = Service(executable_path=edge_driver_path)
-    return webdriver.Edge(service=service, options=options)
-
-def handle_captcha_if_present(driver, url):
-    time.sleep(2)
-    if "captcha" in driver.current_url or "splashui" in driver.current_url:
+def handle_captcha_if_present(driver, url, interactive=True, timings=None):
+    wait_for_dom_ready(driver, step="page_load", timings=timings)
+    if is_captcha_url(driver.current_url):
+        if not interactive:
+            # unattended runs (the scheduler) back off and retry instead of waiting for a person
+            raise CaptchaRequired(f"CAPTCHA at {driver.current_url}")
         safe_print("🧩 CAPTCHA detected. Relaunching browser in visible mode for manual solving...")
         driver.quit()
         driver = create_driver(headless=False)
         driver.get(url)
-        while "captcha" in driver.current_url or "splashui" in driver.current_url:
-            safe_print("⏳ Waiting for CAPTCHA to be solved...")
-            time.sleep(3)
+        safe_print("⏳ Waiting for CAPTCHA to be solved...")
+        wait_for_url(driver, lambda u: not is_captcha_url(u), step="captcha", timeout=CAPTCHA_TIMEOUT, timings=timings)
+        wait_for_dom_ready(driver, step="page_load", timings=timings)
     safe_print("✅ CAPTCHA solved. Continuing...")
     return driver
 
-def safe_get(driver, url, retries=3, wait=3):
+def safe_get(driver, url, retries=3, wait=3, interactive=True, timings=None):
+    # wait is only the backoff between failed attempts; a good load continues as soon as the DOM is ready
     for attempt in range(retries):
         try:
+            throttle(url)
             driver.get(url)
-            driver = handle_captcha_if_present(driver, url)
-            time.sleep(wait)
+            driver = handle_captcha_if_present(driver, url, interactive, timings)
             if "about:blank" in driver.current_url:
                 raise Exception("Blank page loaded")
             return driver
+        except CaptchaRequired:
+            raise
         except Exception as e:
             safe_print(f"⚠️ Navigation attempt {attempt+1} failed: {e}")
             time.sleep(wait)
     safe_print("❌ Failed to load page after retries.")
-    driver.quit()
-    exit()
+    raise RuntimeError(f"Failed to load {url} after {retries} attempts")
 
-def wait_for_feedback_rows():
-    WebDriverWait(driver, 20).until(
-        EC.presence_of_all_elements_located((By.CSS_SELECTOR, "tr[data-feedback-id]"))
-    )
+def wait_for_feedback_rows(driver, timings=None):
+    wait_for_rows(driver, step="feedback_rows", timings=timings)
 
-def scrape_feedback_table():
+# All rows in one execute_script round trip instead of ~6 WebDriver calls per row
+EXTRACT_ROWS_JS = """
+const rows = document.querySelectorAll("tr[data-feedback-id]");
+return JSON.stringify(Array.from(rows, row => {
+    const comment = row.querySelector(".card__comment span[aria-label]");
+    const date = row.querySelector("td span[aria-label*='Past']");
+    let rating_type = "Unknown";
+    if (row.querySelector("svg.icon--feedback-positive")) rating_type = "Positive";
+    else if (row.querySelector("svg.icon--feedback-negative")) rating_type = "Negative";
+    else if (row.querySelector("svg.icon--feedback-neutral")) rating_type = "Neutral";
+    return {
+        id: row.getAttribute("data-feedback-id"),
+        comment: comment ? (comment.getAttribute("aria-label") || "").trim() : "",
+        rating_type: rating_type,
+        date: date ? date.getAttribute("aria-label").trim() : "Unknown"
+    };
+}));
+"""
+
+def scrape_feedback_table(driver, timings=None):
     for attempt in range(3):
         try:
-            rows = driver.find_elements(By.CSS_SELECTOR, "tr[data-feedback-id]")
-            if not rows:
+            data = json.loads(driver.execute_script(EXTRACT_ROWS_JS) or "[]")
+            if not data:
                 raise Exception("No feedback rows found")
-
-            data = []
-            for row in rows:
-                # Extract comment
-                comment_elem = row.find_element(By.CSS_SELECTOR, ".card__comment span[aria-label]")
-                comment = (comment_elem.get_attribute("aria-label") or "").strip()
-
-                # rating type via icon class
-                rating_type = "Unknown"
-                if row.find_elements(By.CSS_SELECTOR, "svg.icon--feedback-positive"):
-                    rating_type = "Positive"
-                elif row.find_elements(By.CSS_SELECTOR, "svg.icon--feedback-negative"):
-                    rating_type = "Negative"
-                elif row.find_elements(By.CSS_SELECTOR, "svg.icon--feedback-neutral"):
-                    rating_type = "Neutral"
-
-
-                # Extract date
-                try:
-                    date_elem = row.find_element(By.CSS_SELECTOR, "td span[aria-label*='Past']")
-                    date_txt = date_elem.get_attribute("aria-label").strip()
-                except NoSuchElementException:
-                    date_txt = "Unknown"
-
-                data.append({
-                    "comment": comment,
-                    "rating_type": rating_type,
-                    "date": date_txt
-                })
             return data
         except Exception as e:
             safe_print(f"⚠️ Scraping attempt {attempt+1} failed: {e}")
-            time.sleep(2)
+            try:
+                wait_for_rows(driver, step="feedback_rows_retry", timeout=5, timings=timings)
+            except Exception:
+                pass
     safe_print("❌ Failed to scrape feedback after 3 attempts.")
     return []
 
-def click_next_page(driver, retries=3):
+def click_next_page(driver, retries=3, timings=None):
     for attempt in range(retries):
         try:
-            next_btn = WebDriverWait(driver, 5).until(
-                EC.element_to_be_clickable((By.ID, "next-page"))
-            )
+            next_btn = timed_wait(driver, "next_button", EC.element_to_be_clickable((By.ID, "next-page")), timeout=5,
+                                  timings=timings)
             if not next_btn.is_enabled():
                 return False
+            before = row_signature(driver)
             driver.execute_script("arguments[0].click();", next_btn)
-            time.sleep(3)
-            wait_for_feedback_rows()
+            # the next page has arrived once the table's first row/count differs
+            wait_for_rows_change(driver, before, step="next_page", timings=timings)
             return True
         except Exception as e:
             safe_print(f"⚠️ Pagination attempt {attempt+1} failed: {e}")
-            time.sleep(2)
     safe_print("🚪 No more pages or failed to paginate.")
     return False
 
-# -------- Start Script --------
-driver = create_driver(headless=True)
+# -------- Scraping engines --------
+MAX_FEEDBACK = 400
+DEFAULT_PAGE_SIZE = 25      # rows eBay shows before the 200-per-page button is clicked
+PAGE_SIZE_TIMEOUT = 5       # a page that was already complete never changes after the click
+
+def scrape_browser(product_url, pool=None, feedback_url=None, interactive=True, max_rows=MAX_FEEDBACK, archive=None,
+                   resolver=None, timings=None):
+    """
+    The Selenium walk on a pooled driver, for pages the HTTP engine can't read (CAPTCHA or JS-only);
+    returns (feedback_url, rows, reached) like scrape_feedback_pages. A known (or cached) feedback_url skips
+    the product and store pages; with interactive=False a CAPTCHA raises CaptchaRequired instead of opening
+    a visible browser. With an archive, paging stops at the seller's high-water mark (up to CATCHUP_ROWS
+    rows). Waits are recorded in timings.
+    """
+    with (pool or get_driver_pool()).lease() as lease:
+        driver = lease.driver
+        try:
+            if feedback_url is None:
+                # -------- Steps 1-2: product page -> store feedback tab -> profile link, cached per item/store --------
+                def load(d, url):
+                    nonlocal driver
+                    driver = safe_get(d, url, interactive=interactive, timings=timings)
+                    lease.count_page()
+                    safe_print(f"[CombinedFeedback] Loaded page: {driver.current_url}")
+                    return driver
+
+                try:
+                    driver, feedback_url = (resolver or get_resolver()).resolve_in_browser(driver, product_url, load)
+                except RuntimeError as e:
+                    safe_print("❌ Couldn't find feedback link:", e)
+                    raise
+
+            safe_print("🔗 Feedback Profile URL:", feedback_url)
+            stop_ids = archive.seen_ids(seller_from_feedback_url(feedback_url)) if archive else set()
+            limit = max(max_rows, CATCHUP_ROWS) if stop_ids else max_rows
+
+            # -------- Step 3: Modify feedback URL to sort by recent --------
+            driver = safe_get(driver, recent_feedback_url(feedback_url), interactive=interactive, timings=timings)
+            lease.count_page()
+
+            # -------- Step 4: Click 200 items per page --------
+            try:
+                wait_for_feedback_rows(driver, timings)
+                if stop_ids:
+                    # a re-check usually finds the last-seen id on the default page; skip the resize then
+                    page_data, reached = until_seen(scrape_feedback_table(driver, timings), stop_ids)
+                    if reached:
+                        safe_print(f"📦 Scraped {len(page_data)} new feedback entries (reached last-seen id)")
+                        return feedback_url, page_data, True
+                before = row_signature(driver)
+                # fewer rows than a default page means the seller's feedback is all here already
+                if before[0] >= DEFAULT_PAGE_SIZE:
+                    button_200 = timed_wait(driver, "page_size_button", EC.element_to_be_clickable(
+                        (By.CSS_SELECTOR, "button[aria-label*='Click to show 200 feedback ratings per page']")),
+                        timeout=10, timings=timings)
+                    driver.execute_script("arguments[0].click();", button_200)
+                    wait_for_rows_change(driver, before, step="page_size", timeout=PAGE_SIZE_TIMEOUT, timings=timings)
+                    lease.count_page()
+            except Exception as e:
+                safe_print("⚠️ Could not set 200 per page:", e)
+
+            # -------- Step 5: Scrape + Paginate --------
+            all_feedback, reached = [], False
+            while len(all_feedback) < limit:
+                page_data, reached = until_seen(scrape_feedback_table(driver, timings), stop_ids)
+                all_feedback.extend(page_data)
+                safe_print(f"📦 Scraped {len(all_feedback)} feedback entries...")
+                if reached:
+                    break
+                if not click_next_page(driver, timings=timings):
+                    reached = True  # last page: nothing older is left out
+                    break
+                lease.count_page()
+            # without a mark there is nothing to connect to: max_rows recent rows is the whole job
+            return feedback_url, all_feedback[:limit], (reached and len(all_feedback) <= limit) or not stop_ids
+        finally:
+            # safe_get may have swapped in a visible browser for a CAPTCHA; hand the current one back
+            lease.driver = driver
+
+def scrape_feedback(product_url=None, feedback_url=None, pool=None, session=None, archive=None,
+                    use_browser=True, interactive=True, max_rows=MAX_FEEDBACK, resolver=None, timings=None):
+    """
+    (seller, engine, rows, reached) for a listing or a known feedback profile: the HTTP engine first, the
+    pooled browser when it can't read the pages. With an archive only rows newer than the seller's
+    high-water mark come back, paging past max_rows (up to CATCHUP_ROWS) to reach the mark; reached is
+    False when even that fell short, i.e. there is a gap between these rows and the archive. CAPTCHAs fall back to the browser only in interactive runs; otherwise they raise,
+    as a 429 (RateLimited) always does.
+    """
+    start = time.perf_counter()
+    resolver = resolver or get_resolver()
+    try:
+        if feedback_url is None:
+            feedback_url = resolver.resolve(product_url, session)
+        safe_print("🔗 Feedback Profile URL:", feedback_url)
+        stop_ids = archive.seen_ids(seller_from_feedback_url(feedback_url)) if archive else set()
+        limit = max(max_rows, CATCHUP_ROWS) if stop_ids else max_rows
+        rows, reached = scrape_feedback_pages(
+            feedback_url, limit, session, stop_ids=stop_ids,
+            on_page=lambda page, total: safe_print(f"📦 Scraped {total} feedback entries..."))
+        # without a mark there is nothing to connect to: max_rows recent rows is the whole job
+        reached = reached or not stop_ids
+        engine = "http"
+        safe_print(f"⚡ HTTP scrape finished in {time.perf_counter() - start:.2f}s")
+    except BrowserRequired as e:
+        if not use_browser or isinstance(e, RateLimited) or (isinstance(e, CaptchaRequired) and not interactive):
+            raise
+        safe_print(f"🧭 Falling back to the browser: {e}")
+        feedback_url, rows, reached = scrape_browser(product_url, pool, feedback_url, interactive, max_rows, archive,
+                                                     resolver, timings)
+        engine = "browser"
+    return seller_from_feedback_url(feedback_url), engine, rows, reached
+
+def report_gap(seller, rows):
+    safe_print(f"⚠️ {seller}: {len(rows)} new feedback entries without reaching the last-seen one; older new "
+               f"entries were not fetched. The high-water mark stays put so the next run continues from it.")
+
+def scrape_to_csv(product_url, out_path="test.csv", pool=None, incremental=INCREMENTAL):
+    """
+    Scrape a listing's seller feedback into out_path (HTTP first, pooled browser as fallback); returns the
+    row count. Incrementally, only feedback newer than the seller's last run is fetched and appended to
+    the archive, and out_path is filled with the seller's most recent MAX_FEEDBACK archived rows.
+    """
+    archive = get_archive() if incremental else None
+    timings = WaitTimings()  # this scrape's waits only, so each log line is one run
+    try:
+        # -------- Steps 1-5: HTTP first, the browser only when the HTTP engine can't read the pages --------
+        seller, engine, all_feedback, reached = scrape_feedback(product_url, pool=pool, archive=archive,
+                                                                timings=timings)
+    finally:
+        if timings.steps:
+            safe_print("⏱️ Browser wait timings:\n" + timings.summary())
+            timings.dump(TIMINGS_LOG, url=product_url)
+
+    if archive is not None:
+        added = archive.ingest(seller, all_feedback, reached)
+        if not reached:
+            report_gap(seller, all_feedback)
+        safe_print(f"🆕 {added} new feedback entries for {seller}")
+        all_feedback = archive.latest(seller, MAX_FEEDBACK)
+
+    safe_print(f"[CombinedFeedback] Scraping completed. Feedback entries: {len(all_feedback)}")
+
+    # -------- Step 6: Save to test.csv without consecutive duplicates --------
+    safe_print(all_feedback)
+    with open(out_path, "w", newline='', encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["comment", "rating_type", "date"])
+        writer.writeheader()
+        last_row = None
+        unique_count = 0
+        for entry in all_feedback:
+            current_row = (entry["comment"], entry["rating_type"], entry["date"])
+            if current_row != last_row:
+                writer.writerow({
+                    "comment": entry["comment"],
+                    "rating_type": entry["rating_type"],
+                    "date": entry["date"]
+                })
+                last_row = current_row
+                unique_count += 1
+
+    load_language(out_path)
+
+    safe_print(f"✅ Done! {unique_count} unique feedback entries saved to {out_path}")
+    if unique_count == 0:
+        safe_print("[CombinedFeedback] WARNING: No feedback entries were scraped. The seller may have no feedback or the page structure has changed.")
+    return unique_count
 
-# -------- Step 1: Go to product page --------
 if __name__ == "__main__":
     if len(sys.argv) > 1:
         product_url = sys.argv[1]
@@ -139,97 +317,10 @@ if __name__ == "__main__":
         safe_print(f"[CombinedFeedback] Using default product URL: {product_url}")
     import traceback
     try:
-        driver = create_driver(headless=True)
-        driver = safe_get(driver, product_url)
-        safe_print(f"[CombinedFeedback] Loaded product page: {driver.current_url}")
-
-        # -------- Step 2: Try to find feedback profile URL --------
-        feedback_url = None
-        try:
-            store_link = driver.find_element(By.XPATH, "//a[contains(@href, '/str/')]")
-            store_url = store_link.get_attribute("href")
-            username = store_url.split("/")[-1].split("?")[0]
-            feedback_tab_url = f"https://www.ebay.com/str/{username}?_tab=feedback"
-            driver = safe_get(driver, feedback_tab_url)
-
-            feedback_button = driver.find_element(By.XPATH, "//a[contains(@href, 'feedback_profile')]")
-            feedback_url = feedback_button.get_attribute("href")
-        except Exception as e:
-            try:
-                feedback_button = driver.find_element(By.XPATH, "//a[contains(@href, '/fdbk/feedback_profile/')]")
-                feedback_url = feedback_button.get_attribute("href")
-            except:
-                try:
-                    feedback_button = driver.find_element(By.XPATH, "//a[contains(@class, 'fdbk-detail-list___btn-container___btn')]")
-                    feedback_url = feedback_button.get_attribute("href")
-                except Exception as final_e:
-                    safe_print("❌ Couldn't find feedback link:", final_e)
-                    driver.quit()
-                    safe_print("[CombinedFeedback] ERROR: No feedback link found. Exiting.")
-                    sys.exit(1)
-
-        safe_print("🔗 Feedback Profile URL:", feedback_url)
-
-        # -------- Step 3: Modify feedback URL to sort by recent --------
-        parsed = urlparse(feedback_url)
-        query_params = parse_qs(parsed.query)
-        query_params['filter'] = [quote('feedback_page: RECEIVED_AS_SELLER')]
-        query_params['sort'] = ['RecentV2']
-        for key in list(query_params):
-            if key not in ['filter', 'sort']:
-                del query_params[key]
-        feedback_url = urlunparse(parsed._replace(query=urlencode(query_params, doseq=True)))
-        driver = safe_get(driver, feedback_url)
-
-        # -------- Step 4: Click 200 items per page --------
-        try:
-            wait_for_feedback_rows()
-            button_200 = WebDriverWait(driver, 10).until(
-                EC.element_to_be_clickable((By.CSS_SELECTOR, "button[aria-label*='Click to show 200 feedback ratings per page']"))
-            )
-            driver.execute_script("arguments[0].click();", button_200)
-            time.sleep(3)
-            wait_for_feedback_rows()
-        except Exception as e:
-            safe_print("⚠️ Could not set 200 per page:", e)
-
-        # -------- Step 5: Scrape + Paginate --------
-        all_feedback = []
-        while len(all_feedback) < 400:
-            page_data = scrape_feedback_table()
-            all_feedback.extend(page_data)
-            safe_print(f"📦 Scraped {len(all_feedback)} feedback entries...")
-            if not click_next_page(driver):
-                break
-
-        safe_print(f"[CombinedFeedback] Scraping completed. Feedback entries: {len(all_feedback)}")
-
-        # -------- Step 6: Save to test.csv without consecutive duplicates --------
-        safe_print(all_feedback)
-        with open("test.csv", "w", newline='', encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=["comment", "rating_type", "date"])
-            writer.writeheader()
-            last_row = None
-            unique_count = 0
-            for entry in all_feedback:
-                current_row = (entry["comment"], entry["rating_type"], entry["date"])
-                if current_row != last_row:
-                    writer.writerow({
-                        "comment": entry["comment"],
-                        "rating_type": entry["rating_type"],
-                        "date": entry["date"]
-                    })
-                    last_row = current_row
-                    unique_count += 1
-
-        load_language('test.csv')
-
-        safe_print(f"✅ Done! {unique_count} unique feedback entries saved to test.csv")
-        if unique_count == 0:
-            safe_print("[CombinedFeedback] WARNING: No feedback entries were scraped. The seller may have no feedback or the page structure has changed.")
+        scrape_to_csv(product_url)
     except Exception as e:
         safe_print(f"[CombinedFeedback] ERROR: {e}")
         safe_print(traceback.format_exc())
         sys.exit(1)
     finally:
-        driver.quit()
+        get_driver_pool().close()
@@ -0,0 +1,250 @@
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import hashlib
+import random
+import pandas as pd
+import torch
+from SharedResources import lazy_singleton
+
+# fastText-style student distilled from the BART-MNLI zero-shot labels:
+# hashed word uni/bigrams -> mean EmbeddingBag -> one logit per ISSUE_CATEGORIES label
+TEACHER_PATH = "data/distill_teacher.csv"
+MODEL_PATH = "data/distilled_classifier.pt"
+REPORT_PATH = "data/distill_report.json"
+# 2**18 x 64 float32 = 64 MiB of embeddings; collisions cost little at review-comment vocabulary sizes
+BUCKETS = 2 ** 18
+DIM = 64
+TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+
+def ngram_ids(text: str, buckets=BUCKETS) -> list[int]:
+    words = TOKEN_RE.findall(text.lower())
+    grams = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    # crc32 is stable across processes, unlike hash()
+    return [zlib.crc32(g.encode("utf-8")) % buckets for g in grams] or [0]
+
+
+class FastTextHead(torch.nn.Module):
+    def __init__(self, n_labels: int, buckets=BUCKETS, dim=DIM):
+        super().__init__()
+        # sparse gradients: a training step only touches the rows of the n-grams in its batch
+        self.embedding = torch.nn.EmbeddingBag(buckets, dim, mode="mean", sparse=True)
+        self.out = torch.nn.Linear(dim, n_labels)
+
+    def forward(self, ids, offsets):
+        return self.out(self.embedding(ids, offsets))
+
+
+def pack(texts: list[str], buckets=BUCKETS):
+    """Flatten n-gram ids into the (ids, offsets) layout EmbeddingBag expects."""
+    ids, offsets = [], []
+    for t in texts:
+        offsets.append(len(ids))
+        ids.extend(ngram_ids(t, buckets))
+    return torch.tensor(ids, dtype=torch.long), torch.tensor(offsets, dtype=torch.long)
+
+
+class DistilledClassifier:
+    def __init__(self, model: FastTextHead, labels: list[str], buckets=BUCKETS):
+        self.model = model.eval()
+        self.labels = labels
+        self.buckets = buckets
+
+    @classmethod
+    def load(cls, path=MODEL_PATH) -> "DistilledClassifier":
+        state = torch.load(path, map_location="cpu")
+        model = FastTextHead(len(state["labels"]), state["buckets"], state["dim"])
+        model.load_state_dict(state["state_dict"])
+        return cls(model, state["labels"], state["buckets"])
+
+    def save(self, path=MODEL_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        torch.save({
+            "labels": self.labels,
+            "buckets": self.buckets,
+            "dim": self.model.out.in_features,
+            "state_dict": self.model.state_dict(),
+        }, path)
+
+    @torch.no_grad()
+    def predict_proba(self, texts: list[str], batch_size=4096) -> torch.Tensor:
+        probs = []
+        for start in range(0, len(texts), batch_size):
+            ids, offsets = pack(texts[start:start + batch_size], self.buckets)
+            probs.append(torch.sigmoid(self.model(ids, offsets)))
+        return torch.cat(probs) if probs else torch.zeros((0, len(self.labels)))
+
+    def predict(self, texts: list[str], min_conf=0.5, topk=3) -> list[list[str]]:
+        """Same contract as AIAnalysis.ai_fallback_batch: up to topk labels above min_conf, best first."""
+        out = []
+        for text, row in zip(texts, self.predict_proba(texts)):
+            if not text.strip():
+                out.append([])
+                continue
+            scores, idx = row.sort(descending=True)
+            out.append([self.labels[j] for s, j in zip(scores.tolist()[:topk], idx.tolist()[:topk]) if s >= min_conf])
+        return out
+
+
+@lazy_singleton
+def get_student() -> DistilledClassifier:
+    """The trained student at MODEL_PATH, read on the first fallback batch that needs it."""
+    if not os.path.exists(MODEL_PATH):
+        raise FileNotFoundError(f"{MODEL_PATH} missing, run DistilledClassifier.py to train it")
+    return DistilledClassifier.load(MODEL_PATH)
+
+_version = (None, None)
+
+def model_version(path=MODEL_PATH) -> str:
+    """Short content hash of the saved student, so cached labels from an older model aren't reused."""
+    global _version
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    if _version[0] != stamp:
+        h = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        _version = (stamp, h.hexdigest()[:12])
+    return _version[1]
+
+def distilled_fallback_batch(texts: list[str], min_conf=0.5, topk=3) -> list[list[str]]:
+    """Drop-in replacement for ai_fallback_batch backed by the distilled student."""
+    return get_student().predict(texts, min_conf=min_conf, topk=topk)
+
+
+# ========= Training =========
+def load_texts(source: str, sample: int, seed=0) -> list[str]:
+    """Review texts from a fastText-format .txt (like data/train.txt) or a CSV with a text/comment column."""
+    if source.endswith(".csv"):
+        df = pd.read_csv(source)
+        col = "text" if "text" in df.columns else "comment"
+        texts = df[col].dropna().astype(str).tolist()
+    else:
+        from loaddataframe import load_fasttext_format
+        texts = load_fasttext_format(source, columns=["text"])["text"].tolist()
+    texts = [t.strip() for t in texts if t.strip()]
+    random.Random(seed).shuffle(texts)
+    return texts[:sample]
+
+def teacher_labels(texts: list[str], batch_size: int, relabel=False) -> pd.DataFrame:
+    """BART-MNLI labels for texts, stored in TEACHER_PATH so retraining doesn't re-run the teacher."""
+    import AIAnalysis
+    if os.path.exists(TEACHER_PATH) and not relabel:
+        cached = pd.read_csv(TEACHER_PATH, keep_default_na=False)
+        done = set(cached["text"])
+    else:
+        cached = pd.DataFrame(columns=["text", "labels"])
+        done = set()
+    todo = [t for t in dict.fromkeys(texts) if t not in done]
+    if todo:
+        print(f"🧑‍🏫 Labelling {len(todo)} texts with {AIAnalysis.ZSC_MODEL}...")
+        labels = AIAnalysis.ai_fallback_batch(todo, batch_size=batch_size)
+        new = pd.DataFrame({"text": todo, "labels": [json.dumps(l) for l in labels]})
+        cached = pd.concat([cached, new], ignore_index=True)
+        os.makedirs(os.path.dirname(TEACHER_PATH), exist_ok=True)
+        cached.to_csv(TEACHER_PATH, index=False)
+    wanted = set(texts)
+    return cached[cached["text"].isin(wanted)].reset_index(drop=True)
+
+def multi_hot(label_lists, labels: list[str]) -> torch.Tensor:
+    col = {l: j for j, l in enumerate(labels)}
+    y = torch.zeros((len(label_lists), len(labels)))
+    for i, ls in enumerate(label_lists):
+        for l in ls:
+            y[i, col[l]] = 1.0
+    return y
+
+def evaluate(student: DistilledClassifier, texts: list[str], label_lists, min_conf=0.5, topk=3) -> dict:
+    """Agreement with the teacher: per-label and micro precision/recall/F1, exact set match, speed."""
+    start = time.perf_counter()
+    preds = student.predict(texts, min_conf=min_conf, topk=topk)
+    elapsed = time.perf_counter() - start
+
+    per_label = {}
+    tp_all = fp_all = fn_all = 0
+    for label in student.labels:
+        tp = sum(label in p and label in t for p, t in zip(preds, label_lists))
+        fp = sum(label in p and label not in t for p, t in zip(preds, label_lists))
+        fn = sum(label not in p and label in t for p, t in zip(preds, label_lists))
+        tp_all, fp_all, fn_all = tp_all + tp, fp_all + fp, fn_all + fn
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        per_label[label] = {"precision": round(precision, 4), "recall": round(recall, 4),
+                            "f1": round(f1, 4), "support": tp + fn}
+    precision = tp_all / (tp_all + fp_all) if tp_all + fp_all else 0.0
+    recall = tp_all / (tp_all + fn_all) if tp_all + fn_all else 0.0
+    return {
+        "examples": len(texts),
+        "exact_match": round(sum(set(p) == set(t) for p, t in zip(preds, label_lists)) / max(len(texts), 1), 4),
+        "micro_precision": round(precision, 4),
+        "micro_recall": round(recall, 4),
+        "micro_f1": round(2 * precision * recall / (precision + recall) if precision + recall else 0.0, 4),
+        "ms_per_1000": round(1000 * elapsed / max(len(texts), 1) * 1000, 2),
+        "per_label": per_label,
+    }
+
+def train(texts: list[str], label_lists, labels: list[str], epochs=5, lr=0.05, batch_size=256, seed=0):
+    torch.manual_seed(seed)
+    model = FastTextHead(len(labels))
+    # SparseAdam updates only the embedding rows a batch used; the small output layer stays on dense Adam
+    optimizers = [torch.optim.SparseAdam(model.embedding.parameters(), lr=lr),
+                  torch.optim.Adam(model.out.parameters(), lr=lr)]
+    loss_fn = torch.nn.BCEWithLogitsLoss()
+    y = multi_hot(label_lists, labels)
+    order = list(range(len(texts)))
+    for epoch in range(epochs):
+        random.Random(seed + epoch).shuffle(order)
+        model.train()
+        total = 0.0
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            ids, offsets = pack([texts[i] for i in batch])
+            for optimizer in optimizers:
+                optimizer.zero_grad()
+            loss = loss_fn(model(ids, offsets), y[batch])
+            loss.backward()
+            for optimizer in optimizers:
+                optimizer.step()
+            total += loss.item() * len(batch)
+        print(f"📉 Epoch {epoch + 1}/{epochs} loss {total / max(len(order), 1):.4f}")
+    return DistilledClassifier(model, labels)
+
+def main():
+    import argparse
+    import AIAnalysis
+    parser = argparse.ArgumentParser(description="Distil the BART-MNLI fallback into a fast n-gram classifier")
+    parser.add_argument("--source", default="data/train.txt", help="fastText .txt or CSV with a text column")
+    parser.add_argument("--sample", type=int, default=50_000, help="texts to label with the teacher")
+    parser.add_argument("--holdout", type=float, default=0.1, help="fraction kept back for the report")
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=AIAnalysis.ZSC_BATCH_SIZE,
+                        help="comments per teacher forward pass")
+    parser.add_argument("--relabel", action="store_true", help="ignore cached teacher labels")
+    args = parser.parse_args()
+
+    texts = load_texts(args.source, args.sample)
+    teacher = teacher_labels(texts, args.batch_size, relabel=args.relabel)
+    data = list(zip(teacher["text"], (json.loads(l) for l in teacher["labels"])))
+    split = int(len(data) * (1 - args.holdout))
+    train_set, test_set = data[:split], data[split:]
+
+    student = train([t for t, _ in train_set], [l for _, l in train_set], AIAnalysis.ISSUE_CATEGORIES,
+                    epochs=args.epochs)
+    student.save(MODEL_PATH)
+    report = evaluate(student, [t for t, _ in test_set], [l for _, l in test_set])
+    with open(REPORT_PATH, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Saved {MODEL_PATH}; holdout vs teacher: exact {report['exact_match']}, "
+          f"micro F1 {report['micro_f1']}, {report['ms_per_1000']} ms per 1000 comments")
+    print(f"📝 Full report in {REPORT_PATH}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+import os
+import atexit
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from selenium import webdriver
+from selenium.webdriver.edge.service import Service
+from selenium.webdriver.edge.options import Options
+from FeedbackHttp import add_browser_cookies
+from SharedResources import lazy_singleton
+
+# -------- Setup Edge Options --------
+edge_driver_path = r"msedgedriver.exe"
+
+def create_driver(headless=True):
+    options = Options()
+    if headless:
+        options.add_argument("--headless=new")
+    options.add_argument("--disable-blink-features=AutomationControlled")
+    options.add_argument("--start-maximized")
+    options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36")
+    service = Service(executable_path=edge_driver_path)
+    return webdriver.Edge(service=service, options=options)
+
+# -------- Pool --------
+DRIVER_POOL_SIZE = int(os.getenv("DRIVER_POOL_SIZE", "2"))
+# a driver is quit and replaced after this many page loads, before memory creep sets in
+DRIVER_MAX_PAGES = int(os.getenv("DRIVER_MAX_PAGES", "50"))
+# cheap same-site page a fresh driver visits so saved eBay cookies can be set on it
+COOKIE_ORIGIN = "https://www.ebay.com/robots.txt"
+COOKIE_FIELDS = ("name", "value", "domain", "path", "secure", "httpOnly", "expiry")
+
+
+class Lease:
+    """A driver on loan from the pool. Replace .driver if the session had to be swapped out, and
+    call count_page() per page load so the pool can recycle worn drivers."""
+
+    def __init__(self, driver, pages=0):
+        self.driver = driver
+        self.pages = pages
+
+    def count_page(self, n=1):
+        self.pages += n
+
+
+class DriverPool:
+    """
+    Long-lived headless Edge sessions shared by scrape jobs.
+
+    lease() hands out an idle driver (health-checked first) or starts one while under `size`, and
+    blocks otherwise. Cookies from every returned driver are kept in a shared jar that is loaded into
+    new drivers and the HTTP session, so a solved CAPTCHA or consent banner is paid for once.
+    """
+
+    def __init__(self, size=DRIVER_POOL_SIZE, max_pages=DRIVER_MAX_PAGES, factory=create_driver):
+        self.size = size
+        self.max_pages = max_pages
+        self.factory = factory
+        self.cookies = {}
+        self.stats = Counter()
+        self._idle = []  # (driver, pages loaded so far)
+        self._total = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    @staticmethod
+    def _healthy(driver) -> bool:
+        try:
+            return driver.execute_script("return 1") == 1
+        except Exception:
+            return False
+
+    @staticmethod
+    def _quit(driver):
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def _new_driver(self):
+        driver = self.factory(headless=True)
+        self.stats["created"] += 1
+        with self._cond:
+            cookies = list(self.cookies.values())
+        if cookies:
+            try:
+                driver.get(COOKIE_ORIGIN)
+                for c in cookies:
+                    try:
+                        driver.add_cookie({k: c[k] for k in COOKIE_FIELDS if k in c})
+                    except Exception:
+                        pass  # cookie for another domain
+            except Exception:
+                pass
+        return driver
+
+    def _save_cookies(self, driver):
+        try:
+            cookies = driver.get_cookies()
+        except Exception:
+            return
+        with self._cond:
+            for c in cookies:
+                self.cookies[(c.get("domain"), c["name"])] = c
+        add_browser_cookies(cookies)
+
+    def _acquire(self, timeout):
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("driver pool is closed")
+                if self._idle:
+                    driver, pages = self._idle.pop()
+                    break
+                if self._total < self.size:
+                    self._total += 1
+                    driver, pages = None, 0
+                    break
+                if not self._cond.wait(timeout):
+                    raise TimeoutError(f"no browser free after {timeout}s ({self.size} in use)")
+        if driver is not None and not self._healthy(driver):
+            self.stats["unhealthy"] += 1
+            self._quit(driver)
+            driver = None
+        if driver is None:
+            try:
+                driver = self._new_driver()
+            except Exception:
+                with self._cond:
+                    self._total -= 1
+                    self._cond.notify()
+                raise
+            pages = 0
+        else:
+            self.stats["reused"] += 1
+        return driver, pages
+
+    def _release(self, lease, original):
+        driver = lease.driver
+        self._save_cookies(driver)
+        if driver is not original:
+            # swapped mid-lease (e.g. a visible browser for a CAPTCHA): keep its cookies, not the window
+            self._quit(original)
+            self._quit(driver)
+            driver = None
+        elif lease.pages >= self.max_pages or not self._healthy(driver):
+            self.stats["recycled"] += 1
+            self._quit(driver)
+            driver = None
+        with self._cond:
+            if driver is None or self._closed:
+                if driver is not None:
+                    self._quit(driver)
+                self._total -= 1
+            else:
+                self._idle.append((driver, lease.pages))
+            self._cond.notify()
+
+    @contextmanager
+    def lease(self, timeout=None):
+        driver, pages = self._acquire(timeout)
+        lease = Lease(driver, pages)
+        try:
+            yield lease
+        finally:
+            self._release(lease, driver)
+
+    def warm_up(self, n=1):
+        """Start up to n idle drivers ahead of the first scrape."""
+        for _ in range(n):
+            with self._cond:
+                if self._closed or self._total >= self.size:
+                    return
+                self._total += 1
+            try:
+                driver = self._new_driver()
+            except Exception:
+                with self._cond:
+                    self._total -= 1
+                raise
+            with self._cond:
+                closed = self._closed
+                if closed:
+                    # close() ran while this browser was starting; it can't see it, so quit it here
+                    self._total -= 1
+                else:
+                    self._idle.append((driver, 0))
+                    self._cond.notify()
+            if closed:
+                self._quit(driver)
+                return
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._total -= len(idle)
+        for driver, _ in idle:
+            self._quit(driver)
+
+
+@lazy_singleton
+def get_driver_pool() -> DriverPool:
+    """Pool shared by the scrapers, the CLI and the API; its browsers are quit at interpreter exit."""
+    pool = DriverPool()
+    atexit.register(pool.close)
+    return pool
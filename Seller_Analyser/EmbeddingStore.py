@@ -0,0 +1,165 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+
+def text_ids(model_name: str, texts) -> list[str]:
+    """Content address of each text's embedding: sha1(model name, text)."""
+    return [hashlib.sha1(f"{model_name}\x1f{t}".encode("utf-8")).hexdigest() for t in texts]
+
+
+class EmbeddingStore:
+    """
+    Append-only float16 embedding matrix on disk, read through a memory map.
+
+    A store is a directory holding:
+      vectors.f16  raw row-major float16 rows, appended in place
+      ids.txt      one id per line, line i names row i
+      meta.json    {"dim": ...}
+    Reads are zero-copy views of the map; appends write only the new rows and ids.
+    """
+
+    def __init__(self, path: str, dim: int | None = None):
+        self.path = path
+        self.vectors_path = os.path.join(path, "vectors.f16")
+        self.ids_path = os.path.join(path, "ids.txt")
+        meta_path = os.path.join(path, "meta.json")
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+            if dim is not None and dim != self.dim:
+                raise ValueError(f"{path} holds {self.dim}-d embeddings, not {dim}-d")
+        elif dim is not None:
+            self.dim = dim
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump({"dim": dim}, f)
+        else:
+            raise FileNotFoundError(f"{meta_path} missing; pass dim to create a new store")
+        self._ids = None
+        self._rows = None
+        self._map = None
+        self._recover()
+
+    def _recover(self):
+        """
+        Drop a half-written tail (vectors without ids, ids without vectors, or an id line cut off before
+        its newline) left by an interrupted append, so every id keeps pointing at its own vector.
+        """
+        ids, torn = self._read_ids()
+        row_bytes = 2 * self.dim
+        size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        n = min(len(ids), size // row_bytes)
+        if size != n * row_bytes:
+            with open(self.vectors_path, "r+b") as f:
+                f.truncate(n * row_bytes)
+        if len(ids) != n or torn:
+            ids = ids[:n]
+            with open(self.ids_path, "w", encoding="utf-8") as f:
+                f.writelines(i + "\n" for i in ids)
+        self._ids = ids
+        self._ids_bytes = os.path.getsize(self.ids_path) if os.path.exists(self.ids_path) else 0
+
+    def _read_ids(self) -> tuple[list[str], bool]:
+        """(complete ids, whether the file ends in a torn line); only newline-terminated lines count."""
+        if not os.path.exists(self.ids_path):
+            return [], False
+        with open(self.ids_path, encoding="utf-8", newline="") as f:
+            lines = f.read().split("\n")
+        # the piece after the last newline is "" for a clean file, else a partially written id
+        return lines[:-1], lines[-1] != ""
+
+    def refresh(self) -> int:
+        """Pick up rows another process appended since this store was read; returns how many."""
+        if not os.path.exists(self.ids_path) or os.path.getsize(self.ids_path) == self._ids_bytes:
+            return 0
+        with open(self.ids_path, "rb") as f:
+            f.seek(self._ids_bytes)
+            data = f.read()
+        # a line still being written waits for the next refresh
+        ids = data[:data.rfind(b"\n") + 1].decode("utf-8").split("\n")[:-1]
+        # vectors go to disk before their ids, but never hand out a row the map can't cover
+        ids = ids[:max(0, os.path.getsize(self.vectors_path) // (2 * self.dim) - len(self._ids))]
+        self._extend(ids)
+        return len(ids)
+
+    def _extend(self, ids: list[str]):
+        start = len(self._ids)
+        self._ids.extend(ids)
+        self._ids_bytes += sum(len(i.encode("utf-8")) + 1 for i in ids)
+        if self._rows is not None:
+            self._rows.update({i: start + r for r, i in enumerate(ids)})
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def ids(self) -> list[str]:
+        return self._ids
+
+    def matrix(self) -> np.ndarray:
+        """(rows, dim) float16 read-only memory map; nothing is loaded until it is touched."""
+        if not self._ids:
+            return np.zeros((0, self.dim), dtype=np.float16)
+        if self._map is None or len(self._map) != len(self._ids):
+            self._map = np.memmap(self.vectors_path, dtype=np.float16, mode="r", shape=(len(self._ids), self.dim))
+        return self._map
+
+    def tiles(self, tile_size: int):
+        """Yield (start, float16 view) over consecutive row ranges."""
+        m = self.matrix()
+        for start in range(0, len(m), tile_size):
+            yield start, m[start:start + tile_size]
+
+    def row_of(self, id_: str) -> int | None:
+        if self._rows is None:
+            self._rows = {i: r for r, i in enumerate(self._ids)}
+        return self._rows.get(id_)
+
+    def get(self, ids: list[str]) -> np.ndarray:
+        """Rows for ids, in the order given (KeyError for unknown ids)."""
+        rows = [self.row_of(i) for i in ids]
+        missing = [i for i, r in zip(ids, rows) if r is None]
+        if missing:
+            raise KeyError(f"{len(missing)} ids not in {self.path}, e.g. {missing[0]!r}")
+        return np.asarray(self.matrix()[rows])
+
+    def append(self, ids: list[str], vectors) -> None:
+        """Write new rows at the end of the store; existing rows are never rewritten."""
+        vectors = np.asarray(vectors, dtype=np.float16)
+        if vectors.ndim != 2 or vectors.shape[1] != self.dim or len(vectors) != len(ids):
+            raise ValueError(f"expected ({len(ids)}, {self.dim}) vectors, got {vectors.shape}")
+        if any("\n" in i for i in ids):
+            raise ValueError("ids must not contain newlines")
+        with open(self.vectors_path, "ab") as f:
+            f.write(np.ascontiguousarray(vectors).tobytes())
+        # ids last: a row only exists once its id is on disk
+        with open(self.ids_path, "a", encoding="utf-8") as f:
+            f.writelines(i + "\n" for i in ids)
+        self._extend(ids)
+
+    def ensure(self, ids: list[str], texts: list[str], encode, encode_slice=100_000):
+        """
+        Store rows for ids, first encoding and appending the texts not stored yet.
+        encode(list of texts) -> (n, dim) vectors; new rows are appended a slice at a time so an
+        interrupted run keeps its work. Returns (rows, number of texts encoded).
+        """
+        def slices(new_texts):
+            for start in range(0, len(new_texts), encode_slice):
+                yield encode(new_texts[start:start + encode_slice])
+        return self.ensure_stream(ids, texts, slices)
+
+    def ensure_stream(self, ids: list[str], texts: list[str], encode_slices):
+        """
+        ensure() for encoders that produce vectors in blocks: encode_slices(new texts) yields
+        consecutive (n, dim) blocks in order, and each block is appended as soon as it arrives.
+        """
+        todo = {i: t for i, t in zip(ids, texts) if self.row_of(i) is None}
+        new_ids, new_texts = list(todo), list(todo.values())
+        done = 0
+        if new_texts:
+            for vectors in encode_slices(new_texts):
+                self.append(new_ids[done:done + len(vectors)], vectors)
+                done += len(vectors)
+        return np.array([self.row_of(i) for i in ids], dtype=np.int64), len(new_texts)
@@ -0,0 +1,57 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing as mp
+import numpy as np
+
+# sentence-transformer encode() spread over CPU worker processes. Each worker loads its own copy of
+# the model and runs torch with a bounded thread count, so workers * threads stays near the core count.
+SHARD_SIZE = 8192
+
+_worker_model = None
+
+def _init_encoder(model_name: str, threads: int):
+    global _worker_model
+    import torch
+    torch.set_num_threads(threads)
+    from sentence_transformers import SentenceTransformer
+    _worker_model = SentenceTransformer(model_name, device="cpu")
+
+def _encode_shard(texts: list[str], batch_size: int) -> np.ndarray:
+    # float16 halves what travels back to the parent; the store keeps float16 anyway
+    return _worker_model.encode(texts, batch_size=batch_size, convert_to_numpy=True).astype(np.float16)
+
+
+class EncoderPool:
+    """
+    Worker processes that each encode a shard of texts; results come back shard by shard, in order.
+    Workers are spawned (not forked) so they never inherit the parent's torch thread pool, which means
+    the calling script must be import-safe (guarded by if __name__ == "__main__").
+    """
+
+    def __init__(self, model_name: str, workers=None, threads=None, batch_size=128):
+        cores = os.cpu_count() or 1
+        self.workers = max(1, workers or cores)
+        self.threads = max(1, threads or cores // self.workers)
+        self.batch_size = batch_size
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=mp.get_context("spawn"),
+                                        initializer=_init_encoder, initargs=(model_name, self.threads))
+
+    def imap(self, texts: list[str], shard_size=SHARD_SIZE):
+        """Yield one (n, dim) float16 block per consecutive shard of texts, with two shards per worker in flight."""
+        pending = deque()
+        for start in range(0, len(texts), shard_size):
+            pending.append(self.pool.submit(_encode_shard, texts[start:start + shard_size], self.batch_size))
+            if len(pending) >= 2 * self.workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def close(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
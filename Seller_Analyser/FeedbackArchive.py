@@ -0,0 +1,108 @@
+import csv
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from SharedResources import lazy_singleton, open_sqlite
+
+# Per-seller feedback archive for incremental scraping. Each seller's rows live in an append-only
+# <seller>.csv (oldest first); SQLite keeps the seller's high-water mark, the newest feedback ids
+# already ingested, so the next scrape can stop paginating as soon as it reaches one of them.
+ARCHIVE_DIR = "data/sellers"
+WATERMARK_DB = "watermarks.db"
+# more than one id, so a deleted or hidden newest feedback doesn't turn the next run into a full scrape
+KEEP_IDS = 50
+FIELDS = ["id", "comment", "rating_type", "date"]
+
+
+class FeedbackArchive:
+    """
+    <root>/<seller>.csv files plus <root>/watermarks.db. Thread-safe: ingests for the same seller are
+    serialized, so concurrent jobs for two listings of one seller can't interleave their appends.
+    """
+
+    def __init__(self, root=ARCHIVE_DIR, keep=KEEP_IDS):
+        self.root = root
+        self.keep = keep
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._seller_locks = defaultdict(threading.Lock)
+        self._conn = open_sqlite(
+            os.path.join(root, WATERMARK_DB),
+            "CREATE TABLE IF NOT EXISTS watermarks (seller TEXT PRIMARY KEY, ids TEXT NOT NULL, updated REAL NOT NULL)",
+        )
+
+    def path(self, seller: str) -> str:
+        return os.path.join(self.root, f"{seller}.csv")
+
+    def seen_ids(self, seller: str) -> set:
+        """The seller's high-water mark; empty when nothing was ingested (or the CSV has been removed)."""
+        if not os.path.exists(self.path(seller)):
+            return set()
+        with self._lock:
+            row = self._conn.execute("SELECT ids FROM watermarks WHERE seller=?", (seller,)).fetchone()
+        return set(json.loads(row[0])) if row else set()
+
+    def _archived_ids(self, path: str) -> set:
+        if not os.path.exists(path):
+            return set()
+        with open(path, newline="", encoding="utf-8") as f:
+            return {row["id"] for row in csv.DictReader(f)}
+
+    def ingest(self, seller: str, rows: list[dict], reached=True) -> int:
+        """
+        Append the rows (newest first, as scraped) that aren't archived yet and move the high-water mark
+        to the newest ids; returns how many rows were added. The CSV is flushed before the mark moves, and
+        ids already in the CSV are skipped, so a crash in between can't duplicate rows on the next run.
+        reached=False means the scrape stopped before the current mark: the rows are kept but the mark is
+        not moved, so the next run pages down to it again and fills the gap (those rows then follow the
+        newer ones in the CSV).
+        """
+        path = self.path(seller)
+        with self._seller_locks[seller]:
+            archived = self._archived_ids(path)
+            fresh, seen = [], set()
+            for row in rows:
+                if row["id"] not in archived and row["id"] not in seen:
+                    seen.add(row["id"])
+                    fresh.append(row)
+            if fresh:
+                new_file = not os.path.exists(path)
+                with open(path, "a", newline="", encoding="utf-8") as f:
+                    writer = csv.DictWriter(f, fieldnames=FIELDS, extrasaction="ignore")
+                    if new_file:
+                        writer.writeheader()
+                    writer.writerows(reversed(fresh))
+                    f.flush()
+                    os.fsync(f.fileno())
+            if not reached:
+                return len(fresh)
+            newest = [r["id"] for r in rows]
+            with self._lock:
+                row = self._conn.execute("SELECT ids FROM watermarks WHERE seller=?", (seller,)).fetchone()
+                old = json.loads(row[0]) if row else []
+                ids = list(dict.fromkeys(newest + old))[:self.keep]
+                self._conn.execute("INSERT OR REPLACE INTO watermarks (seller, ids, updated) VALUES (?, ?, ?)",
+                                   (seller, json.dumps(ids), time.time()))
+                self._conn.commit()
+        return len(fresh)
+
+    def latest(self, seller: str, n: int) -> list[dict]:
+        """The seller's n most recent archived rows, newest first (the order the scrapers return)."""
+        path = self.path(seller)
+        if not os.path.exists(path):
+            return []
+        with self._seller_locks[seller], open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+        return rows[::-1][:n]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+@lazy_singleton
+def get_archive() -> FeedbackArchive:
+    """The archive under ARCHIVE_DIR, shared by the API and the scrape scheduler."""
+    return FeedbackArchive()
@@ -0,0 +1,209 @@
+import re
+from urllib.parse import urlparse, parse_qs, urlencode, urlunparse, quote, urljoin
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bs4 import BeautifulSoup
+from SharedResources import lazy_singleton
+
+# eBay feedback profile pages are server-rendered, so the feedback rows can be read with one pooled
+# GET and an HTML parse per page. BrowserRequired tells the caller to fall back to Selenium.
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Connection": "keep-alive",
+}
+TIMEOUT = 15
+PAGE_SIZE = 200
+# a profile with no feedback still renders the (empty) feedback list, or says so in words
+FEEDBACK_LIST = "[class*='fdbk-detail-list'] table, table[class*='fdbk-detail-list']"
+NO_FEEDBACK_RE = re.compile(r"no (?:ratings or )?feedback (?:yet|to show)|(?:has not|hasn't) received any feedback", re.I)
+
+try:
+    import lxml  # noqa: F401  (faster tree builder when installed)
+    PARSER = "lxml"
+except ImportError:
+    PARSER = "html.parser"
+
+
+class BrowserRequired(Exception):
+    """The page can't be read over plain HTTP (CAPTCHA interstitial or rows rendered by JavaScript)."""
+
+
+class CaptchaRequired(BrowserRequired):
+    """eBay redirected to a CAPTCHA / splashui interstitial: the host wants us to slow down."""
+
+
+class RateLimited(CaptchaRequired):
+    """HTTP 429: back off like for a CAPTCHA, but a browser won't get through either."""
+
+
+# optional rate limiter: anything with acquire(url); every eBay request waits on it first
+_limiter = None
+
+def set_rate_limiter(limiter):
+    global _limiter
+    _limiter = limiter
+
+def throttle(url: str):
+    """Wait for the installed rate limiter (if any) before requesting url, over HTTP or in the browser."""
+    if _limiter is not None:
+        _limiter.acquire(url)
+
+@lazy_singleton
+def get_session() -> requests.Session:
+    """
+    Shared keep-alive session; retries transient server errors with backoff. 429 is not retried here:
+    adapter retries would bypass throttle(), so fetch raises RateLimited for the caller's limiter instead.
+    """
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(500, 502, 503, 504), allowed_methods=("GET",))
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def add_browser_cookies(cookies: list[dict], session=None):
+    """Copy Selenium get_cookies() output into the HTTP session, so browser-earned cookies carry over."""
+    jar = (session or get_session()).cookies
+    for c in cookies:
+        jar.set(c["name"], c["value"], domain=c.get("domain"), path=c.get("path", "/"))
+
+def is_captcha_url(url: str) -> bool:
+    return "captcha" in url or "splashui" in url
+
+def fetch(url: str, session=None):
+    """(final url, BeautifulSoup) for url; raises BrowserRequired if eBay answers with a CAPTCHA or a block."""
+    throttle(url)
+    resp = (session or get_session()).get(url, timeout=TIMEOUT)
+    if is_captcha_url(resp.url) or any(is_captcha_url(r.headers.get("Location", "")) for r in resp.history):
+        raise CaptchaRequired(f"CAPTCHA at {resp.url}")
+    if resp.status_code == 429:
+        raise RateLimited(f"HTTP 429 at {resp.url}")
+    if resp.status_code == 403:
+        raise BrowserRequired(f"HTTP client blocked at {resp.url}")
+    resp.raise_for_status()
+    return resp.url, BeautifulSoup(resp.text, PARSER)
+
+def recent_feedback_url(feedback_url: str, page=None, limit=None) -> str:
+    """Feedback profile URL reduced to seller feedback sorted by most recent (optionally a page of it)."""
+    parsed = urlparse(feedback_url)
+    query_params = parse_qs(parsed.query)
+    query_params['filter'] = [quote('feedback_page: RECEIVED_AS_SELLER')]
+    query_params['sort'] = ['RecentV2']
+    for key in list(query_params):
+        if key not in ['filter', 'sort']:
+            del query_params[key]
+    if limit:
+        query_params['limit'] = [str(limit)]
+    if page and page > 1:
+        query_params['page_id'] = [str(page)]
+    return urlunparse(parsed._replace(query=urlencode(query_params, doseq=True)))
+
+def seller_feedback_url(username: str) -> str:
+    return f"https://www.ebay.com/fdbk/feedback_profile/{quote(username)}"
+
+def seller_from_feedback_url(feedback_url: str) -> str:
+    """Seller username from a /fdbk/feedback_profile/<username> URL."""
+    return urlparse(feedback_url).path.rstrip("/").split("/")[-1]
+
+def resolve_feedback_url(product_url: str, session=None, known_store=None) -> str:
+    """
+    Product page -> seller store feedback tab -> feedback profile link, as the Selenium walk does.
+    known_store(name) may return a cached feedback URL for the store and save the store page load.
+    """
+    url, soup = fetch(product_url, session)
+    link = None
+    store_link = soup.select_one("a[href*='/str/']")
+    if store_link:
+        username = store_link["href"].split("/")[-1].split("?")[0]
+        cached = known_store(username) if known_store else None
+        if cached:
+            return cached
+        _, tab = fetch(f"https://www.ebay.com/str/{username}?_tab=feedback", session)
+        link = tab.select_one("a[href*='feedback_profile']")
+    if link is None:
+        link = (soup.select_one("a[href*='/fdbk/feedback_profile/']")
+                or soup.select_one("a[class*='fdbk-detail-list___btn-container___btn']"))
+    if link is None or not link.get("href"):
+        raise BrowserRequired(f"no feedback profile link in the HTML of {url}")
+    return urljoin(url, link["href"])
+
+def parse_feedback_rows(soup: BeautifulSoup) -> list[dict]:
+    """The tr[data-feedback-id] rows as dicts (id, comment, rating_type, date), same fields as the Selenium path."""
+    data = []
+    for row in soup.select("tr[data-feedback-id]"):
+        comment_elem = row.select_one(".card__comment span[aria-label]")
+        comment = (comment_elem.get("aria-label") or "").strip() if comment_elem else ""
+
+        # rating type via icon class
+        rating_type = "Unknown"
+        if row.select_one("svg.icon--feedback-positive"):
+            rating_type = "Positive"
+        elif row.select_one("svg.icon--feedback-negative"):
+            rating_type = "Negative"
+        elif row.select_one("svg.icon--feedback-neutral"):
+            rating_type = "Neutral"
+
+        date_elem = row.select_one("td span[aria-label*='Past']")
+        date_txt = date_elem["aria-label"].strip() if date_elem else "Unknown"
+
+        data.append({
+            "id": row["data-feedback-id"],
+            "comment": comment,
+            "rating_type": rating_type,
+            "date": date_txt,
+        })
+    return data
+
+def is_empty_feedback_page(soup: BeautifulSoup) -> bool:
+    """The page is a feedback profile with nothing in it, as opposed to one whose rows are drawn by JavaScript."""
+    if soup.select_one("tr[data-feedback-id]") is not None:
+        return False
+    return soup.select_one(FEEDBACK_LIST) is not None or NO_FEEDBACK_RE.search(soup.get_text(" ")) is not None
+
+def until_seen(rows: list[dict], stop_ids) -> tuple[list[dict], bool]:
+    """(rows before the first id in stop_ids, whether one was reached); rows are newest first."""
+    for i, row in enumerate(rows):
+        if row["id"] in stop_ids:
+            return rows[:i], True
+    return rows, False
+
+def scrape_feedback_pages(feedback_url: str, max_rows=400, session=None, on_page=None,
+                          stop_ids=None) -> tuple[list[dict], bool]:
+    """
+    (up to max_rows most recent feedback rows, reached), PAGE_SIZE per request. Follows the next-page
+    link when the page has one and otherwise asks for page_id N+1; stops when a page adds no new feedback
+    ids, or at the first id in stop_ids (the seller's high-water mark) so re-checks cost one request.
+    reached is False only when max_rows cut the walk short, i.e. older rows (before the mark) were left.
+    A first page without rows returns [] when it shows an empty feedback list (a seller with no
+    feedback) and otherwise is taken to be rendered client-side and raises BrowserRequired.
+    """
+    url = recent_feedback_url(feedback_url, limit=PAGE_SIZE)
+    seen, data, page = set(), [], 1
+    reached = False
+    while len(data) < max_rows:
+        final_url, soup = fetch(url, session)
+        rows = [r for r in parse_feedback_rows(soup) if r["id"] not in seen]
+        if not rows:
+            if page == 1 and not is_empty_feedback_page(soup):
+                raise BrowserRequired(f"no server-rendered feedback rows at {final_url}")
+            reached = True
+            break
+        seen.update(r["id"] for r in rows)
+        rows, reached = until_seen(rows, stop_ids or ())
+        data.extend(rows)
+        if on_page:
+            on_page(page, len(data))
+        if reached:
+            break
+        next_link = soup.select_one("a#next-page[href], a[rel='next'][href]")
+        if next_link is not None and next_link.get("aria-disabled") == "true":
+            reached = True
+            break
+        page += 1
+        url = (urljoin(final_url, next_link["href"]) if next_link is not None
+               else recent_feedback_url(feedback_url, page=page, limit=PAGE_SIZE))
+    return data[:max_rows], reached and len(data) <= max_rows
@@ -0,0 +1,165 @@
+import os
+import re
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlparse, urlunparse
+from selenium.webdriver.common.by import By
+from SharedResources import lazy_singleton, open_sqlite
+from FeedbackHttp import CaptchaRequired, resolve_feedback_url, seller_from_feedback_url
+
+# Listing -> seller -> feedback profile resolution, cached. Walking product page, store page and
+# feedback tab costs two or three page loads per listing; most listings belong to a few hundred sellers,
+# so item ids and store names are remembered (with a TTL) and a known seller goes straight to its profile.
+RESOLVER_DB = "data/feedback_urls.db"
+DAY = 86400
+# a listing's seller never changes, but listings end and ids are not worth keeping forever
+ITEM_TTL = float(os.getenv("RESOLVER_ITEM_TTL_DAYS", "30")) * DAY
+# sellers can rename, which moves their feedback profile
+SELLER_TTL = float(os.getenv("RESOLVER_SELLER_TTL_DAYS", "7")) * DAY
+
+ITEM_ID_RE = re.compile(r"/itm/(?:[^/?#]+/)?(\d{9,})")
+
+def item_id(product_url: str):
+    """The numeric eBay item id of a listing URL (/itm/<id> or /itm/<slug>/<id>), else None."""
+    m = ITEM_ID_RE.search(urlparse(product_url).path)
+    return m.group(1) if m else None
+
+def canonical_feedback_url(feedback_url: str) -> str:
+    """Feedback profile URL without query or fragment; recent_feedback_url adds the sort and filter back."""
+    return urlunparse(urlparse(feedback_url)._replace(query="", fragment=""))
+
+
+class FeedbackResolver:
+    """
+    SQLite-backed cache of item id -> seller and seller/store name -> canonical feedback URL, used
+    by both the HTTP engine (resolve) and the Selenium walk (resolve_in_browser). Entries older than
+    their TTL are ignored and overwritten by the next walk.
+    """
+
+    def __init__(self, path=RESOLVER_DB, item_ttl=ITEM_TTL, seller_ttl=SELLER_TTL):
+        self.item_ttl = item_ttl
+        self.seller_ttl = seller_ttl
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        self._conn = open_sqlite(
+            path,
+            "CREATE TABLE IF NOT EXISTS items (item_id TEXT PRIMARY KEY, seller TEXT NOT NULL, updated REAL NOT NULL)",
+            "CREATE TABLE IF NOT EXISTS sellers (name TEXT PRIMARY KEY, feedback_url TEXT NOT NULL, updated REAL NOT NULL)",
+        )
+
+    def known_seller(self, name: str):
+        """Fresh feedback URL for a seller username or store name, else None."""
+        with self._lock:
+            row = self._conn.execute("SELECT feedback_url FROM sellers WHERE name=? AND updated>=?",
+                                     (name, time.time() - self.seller_ttl)).fetchone()
+            if row:
+                self.stats["seller_hits"] += 1
+        return row[0] if row else None
+
+    def cached(self, product_url: str):
+        """Feedback URL for a listing whose seller is already known, else None."""
+        item = item_id(product_url)
+        if item is None:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT s.feedback_url FROM items i JOIN sellers s ON s.name = i.seller"
+                " WHERE i.item_id=? AND i.updated>=? AND s.updated>=?",
+                (item, time.time() - self.item_ttl, time.time() - self.seller_ttl)).fetchone()
+            if row:
+                self.stats["item_hits"] += 1
+        return row[0] if row else None
+
+    def _walked(self):
+        with self._lock:
+            self.stats["walks"] += 1
+
+    def remember_item(self, product_url: str, feedback_url: str):
+        """Record listing -> seller only, for a URL that came from the sellers table: re-saving that row
+        would restart its TTL and an active seller would never be re-checked for a rename."""
+        item = item_id(product_url) if product_url else None
+        if item:
+            with self._lock:
+                self._conn.execute("INSERT OR REPLACE INTO items (item_id, seller, updated) VALUES (?, ?, ?)",
+                                   (item, seller_from_feedback_url(feedback_url), time.time()))
+                self._conn.commit()
+        return feedback_url
+
+    def remember(self, product_url: str, feedback_url: str, aliases=()):
+        """Record listing -> seller and seller (plus store names in aliases) -> a feedback URL read from a page."""
+        feedback_url = canonical_feedback_url(feedback_url)
+        seller = seller_from_feedback_url(feedback_url)
+        item = item_id(product_url) if product_url else None
+        now = time.time()
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO sellers (name, feedback_url, updated) VALUES (?, ?, ?)",
+                                   [(name, feedback_url, now) for name in dict.fromkeys((seller, *aliases))])
+            if item:
+                self._conn.execute("INSERT OR REPLACE INTO items (item_id, seller, updated) VALUES (?, ?, ?)",
+                                   (item, seller, now))
+            self._conn.commit()
+        return feedback_url
+
+    def resolve(self, product_url: str, session=None) -> str:
+        """Feedback URL for a listing: from the cache, else the HTTP walk (which stops at a known store)."""
+        url = self.cached(product_url)
+        if url:
+            return url
+        self._walked()
+        stores, hits = [], []
+        def known_store(name):
+            stores.append(name)
+            url = self.known_seller(name)
+            if url:
+                hits.append(url)
+            return url
+        url = resolve_feedback_url(product_url, session, known_store)
+        if hits:
+            return self.remember_item(product_url, url)
+        return self.remember(product_url, url, stores)
+
+    def resolve_in_browser(self, driver, product_url: str, load):
+        """
+        The same walk in Selenium; load(driver, url) navigates and returns the (possibly replaced) driver.
+        Returns (driver, feedback URL); raises RuntimeError when the pages have no feedback link.
+        """
+        url = self.cached(product_url)
+        if url:
+            return driver, url
+        self._walked()
+        driver = load(driver, product_url)
+        stores = []
+        try:
+            store_link = driver.find_element(By.XPATH, "//a[contains(@href, '/str/')]")
+            username = store_link.get_attribute("href").split("/")[-1].split("?")[0]
+            stores.append(username)
+            url = self.known_seller(username)
+            if url is not None:
+                return driver, self.remember_item(product_url, url)
+            driver = load(driver, f"https://www.ebay.com/str/{username}?_tab=feedback")
+            url = driver.find_element(By.XPATH, "//a[contains(@href, 'feedback_profile')]").get_attribute("href")
+        except CaptchaRequired:
+            raise
+        except Exception:
+            # no store: the profile link on the listing itself, then the seller card's "see all feedback"
+            for xpath in ("//a[contains(@href, '/fdbk/feedback_profile/')]",
+                          "//a[contains(@class, 'fdbk-detail-list___btn-container___btn')]"):
+                try:
+                    url = driver.find_element(By.XPATH, xpath).get_attribute("href")
+                    break
+                except Exception:
+                    continue
+            else:
+                raise RuntimeError(f"No feedback link found on {product_url}")
+        return driver, self.remember(product_url, url, stores)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+@lazy_singleton
+def get_resolver() -> FeedbackResolver:
+    """The resolver over RESOLVER_DB, shared by the HTTP engine and the browser walks."""
+    return FeedbackResolver()
@@ -1,99 +1,85 @@
-from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.edge.service import Service
-from selenium.webdriver.edge.options import Options
-import time
 import csv
+from BrowserWaits import WaitTimings, wait_for_dom_ready
+from DriverPool import get_driver_pool
+from FeedbackHttp import BrowserRequired
+from FeedbackResolver import get_resolver
 
-# Setup Edge
-options = Options()
-options.add_argument("--start-maximized")
+product_url = "https://www.ebay.com/itm/406109000959"
+timings = WaitTimings()
 
-edge_driver_path = "C:/Users/Swank/Downloads/edgedriver_win64/msedgedriver.exe"
-service = Service(executable_path=edge_driver_path)
-driver = webdriver.Edge(service=service, options=options)
 
-# Step 1: Go to product page
-product_url = "https://www.ebay.com/itm/406109000959"
-driver.get(product_url)
-time.sleep(3)
-
-# Step 2: Try to find store link
-feedback_url = None
-try:
-    store_link = driver.find_element(By.XPATH, "//a[contains(@href, '/str/')]")
-    store_url = store_link.get_attribute("href")
-    print("🛍️ Store URL:", store_url)
-    driver.get(store_url)
-    time.sleep(3)
-
-    # Step 3: Construct feedback tab URL
-    username = store_url.split("/")[-1].split("?")[0]
-    feedback_tab_url = f"https://www.ebay.com/str/{username}?_tab=feedback"
-    print("📄 Feedback Tab URL:", feedback_tab_url)
-    driver.get(feedback_tab_url)
-    time.sleep(3)
-
-    # Step 4: Click feedback profile button
-    feedback_button = driver.find_element(By.XPATH, "//a[contains(@href, 'feedback_profile')]")
-    feedback_url = feedback_button.get_attribute("href")
-    print("🔗 Feedback Profile URL:", feedback_url)
-    driver.get(feedback_url)
-    time.sleep(3)
-
-except Exception as e:
-    print("⚠️ Store link or feedback tab not found, trying fallback:", e)
-
-    # Fallback 1: Try direct feedback profile link on product page
+def find_feedback_url(lease, product_url):
+    """Steps 1-4: product page -> store feedback tab -> feedback profile, via the cached resolver
+    (a listing or store seen before goes straight to the profile; the browser walk only when HTTP can't)."""
+    resolver = get_resolver()
     try:
-        feedback_button = driver.find_element(By.XPATH, "//a[contains(@href, '/fdbk/feedback_profile/')]")
-        feedback_url = feedback_button.get_attribute("href")
-        print("🔗 Fallback Feedback Profile URL:", feedback_url)
-        driver.get(feedback_url)
-        time.sleep(3)
-    except:
-        # Fallback 2: Try "View all feedback" button in seller card
-        try:
-            feedback_button = driver.find_element(By.XPATH, "//a[contains(@class, 'fdbk-detail-list___btn-container___btn')]")
-            feedback_url = feedback_button.get_attribute("href")
-            print("🔗 Seller Card Feedback URL:", feedback_url)
-            driver.get(feedback_url)
-            time.sleep(3)
-        except Exception as final_e:
-            print("❌ Couldn't find any feedback link:", final_e)
-            driver.quit()
-            exit()
-
-# Step 5: Confirm we're on feedback profile page
-print("✅ Final Page Title:", driver.title)
-
-# Step 6: Scrape feedback sentiment and comment
-try:
-    feedback_cards = driver.find_elements(By.CSS_SELECTOR, "div.card_text")
-
-    with open("feedback_data.csv", "w", newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        writer.writerow(["Sentiment", "Comment"])
-
-        for card in feedback_cards:
-            try:
-                sentiment_svg = card.find_element(By.CSS_SELECTOR, "div.card_rating svg[aria-label]")
-                sentiment = sentiment_svg.get_attribute("aria-label")
+        return resolver.resolve(product_url)
+    except BrowserRequired as e:
+        print("⚠️ HTTP walk failed, using the browser:", e)
+
+    def load(d, url):
+        d.get(url)
+        wait_for_dom_ready(d, step="walk_page", timings=timings)
+        lease.count_page()
+        return d
+
+    lease.driver, feedback_url = resolver.resolve_in_browser(lease.driver, product_url, load)
+    return feedback_url
+
+
+def scrape_feedback_cards(driver, out_path="feedback_data.csv"):
+    """Step 6: Scrape feedback sentiment and comment"""
+    try:
+        feedback_cards = driver.find_elements(By.CSS_SELECTOR, "div.card_text")
+
+        with open(out_path, "w", newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(["Sentiment", "Comment"])
 
-                comment_span = card.find_element(By.CSS_SELECTOR, "span[data-testid='fdbk-comment-undefined']")
-                comment = comment_span.text.strip()
+            for card in feedback_cards:
+                try:
+                    sentiment_svg = card.find_element(By.CSS_SELECTOR, "div.card_rating svg[aria-label]")
+                    sentiment = sentiment_svg.get_attribute("aria-label")
 
-                print("📊 Sentiment:", sentiment)
-                print("📝 Feedback:", comment)
-                print("-" * 60)
+                    comment_span = card.find_element(By.CSS_SELECTOR, "span[data-testid='fdbk-comment-undefined']")
+                    comment = comment_span.text.strip()
+
+                    print("📊 Sentiment:", sentiment)
+                    print("📝 Feedback:", comment)
+                    print("-" * 60)
+
+                    writer.writerow([sentiment, comment])
+
+                except Exception as inner_e:
+                    print(f"⚠️ Error extracting feedback: {inner_e}")
+
+    except Exception as e:
+        print("❌ Couldn't scrape feedback:", e)
+
+
+if __name__ == "__main__":
+    # browser from the shared pool (headless, eBay cookies carried over), like the other scrapers
+    pool = get_driver_pool()
+    try:
+        with pool.lease() as lease:
+            try:
+                feedback_url = find_feedback_url(lease, product_url)
+            except Exception as final_e:
+                print("❌ Couldn't find any feedback link:", final_e)
+                raise SystemExit(1)
 
-                writer.writerow([sentiment, comment])
+            print("🔗 Feedback Profile URL:", feedback_url)
+            lease.driver.get(feedback_url)
+            wait_for_dom_ready(lease.driver, step="feedback_profile", timings=timings)
+            lease.count_page()
 
-            except Exception as inner_e:
-                print(f"⚠️ Error extracting feedback: {inner_e}")
+            # Step 5: Confirm we're on feedback profile page
+            print("✅ Final Page Title:", lease.driver.title)
 
-except Exception as e:
-    print("❌ Couldn't scrape feedback:", e)
+            scrape_feedback_cards(lease.driver)
 
-# Done
-driver.quit()
+        # Done
+        print("⏱️ Wait timings:\n" + timings.summary())
+    finally:
+        pool.close()
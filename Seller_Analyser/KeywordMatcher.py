@@ -0,0 +1,153 @@
+import re
+from bisect import bisect_right
+from dataclasses import dataclass, field
+
+from fuzzywuzzy import fuzz
+
+# Words that flip a keyword when they appear up to NEGATION_GAP words before it
+NEGATION_WORDS = {"no", "not", "never", "without"}
+NEGATION_GAP = 3
+
+# cracked/shattered/chipped are always severe damage
+HARD_DAMAGE_WORDS = {"crack", "cracked", "shatter", "shattered", "chip", "chipped"}
+
+WORD_RE = re.compile(r"\w+")
+
+
+@dataclass
+class ScanResult:
+    """Everything the rule engine needs from one pass over a comment."""
+    hits: dict = field(default_factory=dict)      # keyword -> negated?
+    issues: set = field(default_factory=set)      # issues with at least one non-negated keyword
+    severe: bool = False                          # any SEVERE_MODS / hard damage word present
+    minor: bool = False                           # any MINOR_MODS present
+    positive: bool = False                        # any POSITIVE_WORDS present
+
+
+def _trie_regex(words) -> str:
+    """
+    Build a regex alternation shaped like a trie, e.g. {crack, cracked, chip} -> c(?:hip|rack(?:ed)?).
+    Matching at a position costs O(longest word) instead of O(number of words).
+    Children are tried before ending, so the longest phrase at a position wins.
+    """
+    trie = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node) -> str:
+        terminal = "" in node
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if terminal else body
+
+    return build(trie)
+
+
+def _fuzzy_pieces(s: str, threshold: int) -> list[str]:
+    """
+    fuzz.partial_ratio only accepts k edits while they still round above threshold.
+    With k edits one of k+1 slices of s must appear verbatim, which gates the expensive fuzzy call.
+    """
+    edits = 0
+    while round(100 * (1 - (edits + 1) / len(s))) >= threshold:
+        edits += 1
+    step = len(s) / (edits + 1)
+    return [s[round(i * step):round((i + 1) * step)] for i in range(edits + 1)]
+
+
+class KeywordMatcher:
+    """
+    Compiled multi-pattern matcher over the issue keywords, severity modifiers and positive words.
+    One regex scan finds every phrase occurrence (as a substring, like the old fuzz.partial_ratio check),
+    negation is resolved from a single word tokenisation, and only long keywords that could still pass
+    the fuzzy threshold with one typo get an approximate pass.
+    """
+
+    def __init__(self, issue_keywords: dict, severe_mods, minor_mods, positive_words, threshold=95):
+        self.threshold = threshold
+        self.kw_issues = {}
+        for issue, kws in issue_keywords.items():
+            for kw in kws:
+                self.kw_issues.setdefault(kw.lower(), []).append(issue)
+        self.severe_words = {w.lower() for w in severe_mods} | HARD_DAMAGE_WORDS
+        self.minor_words = {w.lower() for w in minor_mods}
+        self.positive_words = {w.lower() for w in positive_words}
+
+        phrases = set(self.kw_issues) | self.severe_words | self.minor_words | self.positive_words
+        # A match only reports the longest phrase at a position; its prefixes matched there too
+        self.prefixes = {p: [q for q in phrases if p.startswith(q)] for p in phrases}
+        self.phrase_re = re.compile(f"(?=({_trie_regex(phrases)}))")
+
+        # Keywords sorted by length, for comments shorter than a keyword (partial_ratio then looks for
+        # the comment inside the keyword, so "As described" still hits "not as described")
+        self.kws_by_len = sorted(self.kw_issues, key=len)
+        self.kw_lens = [len(kw) for kw in self.kws_by_len]
+
+        # Only keywords long enough to survive a typo need the approximate pass on longer comments
+        self.fuzzy_kws = [(kw, pieces) for kw in self.kws_by_len
+                          if len(pieces := _fuzzy_pieces(kw, threshold)) > 1]
+
+    def scan(self, text: str) -> ScanResult:
+        t = text.lower()
+        found = {}  # phrase -> list of start offsets
+        for m in self.phrase_re.finditer(t):
+            for p in self.prefixes[m.group(1)]:
+                found.setdefault(p, []).append(m.start())
+
+        res = ScanResult()
+        res.severe = any(p in found for p in self.severe_words)
+        res.minor = any(p in found for p in self.minor_words)
+        res.positive = any(p in found for p in self.positive_words)
+
+        words = [(w.start(), w.group() in NEGATION_WORDS) for w in WORD_RE.finditer(t)]
+        starts = [w[0] for w in words]
+
+        for kw, offsets in found.items():
+            if kw not in self.kw_issues:
+                continue
+            negated = any(self._negated(t, kw, s, words, starts) for s in offsets)
+            self._record(res, kw, negated)
+
+        # Approximate pass: comments shorter than a keyword, then typo'd long keywords with no exact hit.
+        # A keyword that is not verbatim in the text can never be negated (same as the old regex).
+        if not t:
+            return res
+        if len(t) < self.kw_lens[-1]:
+            t_pieces = _fuzzy_pieces(t, self.threshold)
+            for kw in self.kws_by_len[bisect_right(self.kw_lens, len(t)):]:
+                if any(p in kw for p in t_pieces) and fuzz.partial_ratio(kw, t) >= self.threshold:
+                    self._record(res, kw, False)
+        for kw, pieces in self.fuzzy_kws:
+            if len(kw) > len(t):
+                break
+            if kw not in res.hits and any(p in t for p in pieces) and fuzz.partial_ratio(kw, t) >= self.threshold:
+                self._record(res, kw, False)
+        return res
+
+    def _record(self, res: ScanResult, kw: str, negated: bool):
+        res.hits[kw] = negated
+        if not negated:
+            res.issues.update(self.kw_issues[kw])
+
+    @staticmethod
+    def _negated(t: str, kw: str, start: int, words, starts) -> bool:
+        """
+        Same rule as the old regex: \\b(no|not|never|without)\\b, up to NEGATION_GAP words, then \\bkw\\b.
+        """
+        end = start + len(kw)
+        if start > 0 and (t[start - 1].isalnum() or t[start - 1] == "_"):
+            return False
+        if end < len(t) and (t[end].isalnum() or t[end] == "_") and (kw[-1].isalnum() or kw[-1] == "_"):
+            return False
+        i = bisect_right(starts, start) - 1  # word containing/starting at the keyword
+        if i < 0 or words[i][0] != start:
+            i = bisect_right(starts, start)  # keyword starts with punctuation: next word
+        for j in range(i - 1, max(i - NEGATION_GAP - 2, -1), -1):
+            if words[j][1]:
+                return True
+        return False
@@ -0,0 +1,243 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from dataclasses import dataclass, asdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+import FeedbackHttp
+from FeedbackHttp import CaptchaRequired, RateLimited, get_session, seller_feedback_url
+from BrowserWaits import WaitTimings
+from CombinedFeedback import safe_print, scrape_feedback, report_gap, MAX_FEEDBACK, TIMINGS_LOG
+from DriverPool import get_driver_pool
+from FeedbackArchive import FeedbackArchive, ARCHIVE_DIR
+from FeedbackResolver import get_resolver
+
+# Many sellers scraped concurrently by a thread pool. Every eBay request (HTTP or browser) first takes
+# a token from a global and a per-host bucket; a CAPTCHA/splashui redirect puts the host on a jittered,
+# exponentially growing cooldown that all workers honour, and the job is retried after it; an HTTP 429
+# is treated the same way.
+SCRAPE_CONCURRENCY = int(os.getenv("SCRAPE_CONCURRENCY", "8"))   # keep <= the HTTP session's pool (16)
+SCRAPE_RATE = float(os.getenv("SCRAPE_RATE", "4"))               # requests/s over all hosts
+SCRAPE_HOST_RATE = float(os.getenv("SCRAPE_HOST_RATE", "2"))     # requests/s per host
+SCRAPE_BURST = int(os.getenv("SCRAPE_BURST", "4"))
+CAPTCHA_BACKOFF = 30.0      # first cooldown after a CAPTCHA, doubled per consecutive CAPTCHA on the host
+CAPTCHA_BACKOFF_MAX = 900.0
+MAX_ATTEMPTS = 4
+REPORT_NAME = "scrape_report.jsonl"
+
+
+class TokenBucket:
+    """rate tokens/s up to burst. reserve() takes a token now and says how long to wait before using it,
+    so waiting callers are served in arrival order without holding the lock while they sleep."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class RateLimiter:
+    """Global + per-host token buckets and per-host CAPTCHA cooldowns; install with FeedbackHttp.set_rate_limiter."""
+
+    def __init__(self, rate=SCRAPE_RATE, host_rate=SCRAPE_HOST_RATE, burst=SCRAPE_BURST,
+                 backoff=CAPTCHA_BACKOFF, backoff_max=CAPTCHA_BACKOFF_MAX):
+        self.global_bucket = TokenBucket(rate, burst)
+        self.host_rate = host_rate
+        self.burst = burst
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.hosts = {}
+        self.cooldown_until = {}
+        self.strikes = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def host(url: str) -> str:
+        return urlparse(url).hostname or url
+
+    def acquire(self, url: str):
+        host = self.host(url)
+        with self._lock:
+            bucket = self.hosts.get(host)
+            if bucket is None:
+                bucket = self.hosts[host] = TokenBucket(self.host_rate, self.burst)
+        # sit out a CAPTCHA cooldown before taking tokens, so the bucket isn't drained by sleepers
+        while (wait := self.cooldown_until.get(host, 0.0) - time.monotonic()) > 0:
+            time.sleep(wait)
+        wait = max(bucket.reserve(), self.global_bucket.reserve())
+        if wait > 0:
+            time.sleep(wait)
+
+    def penalize(self, url: str) -> float:
+        """CAPTCHA on url's host: cool the host down for backoff * 2^strikes seconds, +-50% jitter."""
+        host = self.host(url)
+        with self._lock:
+            strikes = self.strikes.get(host, 0)
+            delay = min(self.backoff_max, self.backoff * 2 ** strikes) * random.uniform(0.5, 1.5)
+            self.strikes[host] = strikes + 1
+            self.cooldown_until[host] = max(self.cooldown_until.get(host, 0.0), time.monotonic() + delay)
+        return delay
+
+    def reward(self, url: str):
+        """A clean scrape on the host resets its backoff."""
+        with self._lock:
+            self.strikes.pop(self.host(url), None)
+
+
+@dataclass
+class JobResult:
+    target: str
+    seller: str = ""
+    engine: str = ""
+    rows: int = 0
+    new: int = 0
+    attempts: int = 0
+    captchas: int = 0
+    seconds: float = 0.0
+    path: str = ""
+    error: str = ""
+    gap: bool = False       # stopped before the seller's high-water mark; the next run continues
+
+
+def is_product_url(target: str) -> bool:
+    return target.startswith(("http://", "https://"))
+
+def read_targets(path: str) -> list[str]:
+    """One product URL or seller username per line; blank lines, # comments and repeats are skipped."""
+    with open(path, encoding="utf-8") as f:
+        lines = (line.strip() for line in f)
+        return list(dict.fromkeys(l for l in lines if l and not l.startswith("#")))
+
+
+class ScrapeScheduler:
+    """
+    Scrapes a queue of sellers with at most `concurrency` jobs in flight. Each job runs the HTTP engine
+    and, with use_browser, falls back to a pooled headless browser (never an interactive CAPTCHA window).
+    New rows are appended to the seller's archive in out_dir; incrementally, paging stops at the
+    seller's high-water mark, so a seller with nothing new costs a single request.
+    """
+
+    def __init__(self, out_dir=ARCHIVE_DIR, concurrency=SCRAPE_CONCURRENCY, limiter=None, max_rows=MAX_FEEDBACK,
+                 max_attempts=MAX_ATTEMPTS, use_browser=False, pool=None, incremental=True):
+        self.out_dir = out_dir
+        self.archive = FeedbackArchive(out_dir)
+        self.incremental = incremental
+        self.concurrency = concurrency
+        self.limiter = limiter or RateLimiter()
+        self.max_rows = max_rows
+        self.max_attempts = max_attempts
+        self.use_browser = use_browser
+        self.pool = pool
+        self.session = get_session()
+
+    def run_job(self, target: str) -> JobResult:
+        result = JobResult(target)
+        start = time.perf_counter()
+        product_url = target if is_product_url(target) else None
+        feedback_url = None if product_url else seller_feedback_url(target)
+        probe = product_url or feedback_url
+        timings = WaitTimings()
+        for attempt in range(1, self.max_attempts + 1):
+            result.attempts = attempt
+            try:
+                result.seller, result.engine, rows, reached = scrape_feedback(
+                    product_url, feedback_url, self.pool, self.session, self.archive if self.incremental else None,
+                    use_browser=self.use_browser, interactive=False, max_rows=self.max_rows, timings=timings)
+                result.rows = len(rows)
+                result.new = self.archive.ingest(result.seller, rows, reached)
+                result.gap = not reached
+                if result.gap:
+                    report_gap(result.seller, rows)
+                result.path = self.archive.path(result.seller)
+                result.error = ""
+                self.limiter.reward(probe)
+                break
+            except CaptchaRequired as e:
+                result.captchas += 1
+                result.error = str(e)
+                delay = self.limiter.penalize(probe)
+                reason = "rate limited (429)" if isinstance(e, RateLimited) else "CAPTCHA"
+                safe_print(f"🧩 {target}: {reason} (attempt {attempt}/{self.max_attempts}), host cooling down {delay:.0f}s")
+            except Exception as e:
+                result.error = f"{type(e).__name__}: {e}"
+                break
+        result.seconds = round(time.perf_counter() - start, 2)
+        if timings.steps:
+            timings.dump(TIMINGS_LOG, url=target, run="scheduler")
+        return result
+
+    def run(self, targets: list[str]) -> list[JobResult]:
+        os.makedirs(self.out_dir, exist_ok=True)
+        report_path = os.path.join(self.out_dir, REPORT_NAME)
+        previous = FeedbackHttp._limiter
+        FeedbackHttp.set_rate_limiter(self.limiter)
+        results = []
+        start = time.perf_counter()
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="scrape")
+        try:
+            futures = [executor.submit(self.run_job, t) for t in targets]
+            with open(report_path, "a", encoding="utf-8") as report:
+                for done, fut in enumerate(as_completed(futures), start=1):
+                    r = fut.result()
+                    results.append(r)
+                    report.write(json.dumps({"time": time.strftime("%Y-%m-%dT%H:%M:%S"), **asdict(r)}) + "\n")
+                    report.flush()
+                    mark = "✅" if not r.error else "❌"
+                    safe_print(f"{mark} [{done}/{len(targets)}] {r.seller or r.target}: {r.new} new of {r.rows} rows "
+                               f"via {r.engine or '-'} in {r.seconds}s" + (f" ({r.error})" if r.error else ""))
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            FeedbackHttp.set_rate_limiter(previous)
+        elapsed = time.perf_counter() - start
+        ok = sum(1 for r in results if not r.error)
+        safe_print(f"🏁 {ok}/{len(targets)} sellers scraped in {elapsed:.1f}s ({sum(r.new for r in results)} new "
+                   f"of {sum(r.rows for r in results)} rows, {sum(r.captchas for r in results)} CAPTCHAs)")
+        hits = get_resolver().stats
+        safe_print(f"🗂️ Feedback URL cache: {hits['item_hits']} listings and {hits['seller_hits']} stores known, "
+                   f"{hits['walks']} walked")
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrape seller feedback for many sellers concurrently.")
+    parser.add_argument("targets", help="file with one product URL or seller username per line")
+    parser.add_argument("--out", default=ARCHIVE_DIR, help="archive directory: <seller>.csv files, watermarks, run report")
+    parser.add_argument("--concurrency", type=int, default=SCRAPE_CONCURRENCY)
+    parser.add_argument("--rate", type=float, default=SCRAPE_RATE, help="requests/s over all hosts")
+    parser.add_argument("--host-rate", type=float, default=SCRAPE_HOST_RATE, help="requests/s per host")
+    parser.add_argument("--burst", type=int, default=SCRAPE_BURST)
+    parser.add_argument("--max-rows", type=int, default=MAX_FEEDBACK)
+    parser.add_argument("--attempts", type=int, default=MAX_ATTEMPTS, help="tries per seller when CAPTCHAs hit")
+    parser.add_argument("--browser", action="store_true", help="fall back to pooled headless browsers")
+    parser.add_argument("--full", action="store_true", help="ignore high-water marks and re-scrape up to --max-rows")
+    args = parser.parse_args()
+
+    targets = read_targets(args.targets)
+    safe_print(f"📋 {len(targets)} sellers queued, {args.concurrency} at a time")
+    scheduler = ScrapeScheduler(args.out, args.concurrency, RateLimiter(args.rate, args.host_rate, args.burst),
+                                max_rows=args.max_rows, max_attempts=args.attempts, use_browser=args.browser,
+                                incremental=not args.full)
+    try:
+        results = scheduler.run(targets)
+    finally:
+        if args.browser:
+            get_driver_pool().close()
+    sys.exit(0 if any(not r.error for r in results) or not results else 1)
+
+
+if __name__ == "__main__":
+    main()
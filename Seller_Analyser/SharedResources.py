@@ -0,0 +1,43 @@
+import functools
+import os
+import sqlite3
+import threading
+
+# Helpers for the process-wide objects the API, the scheduler and the CLIs share: models, pools,
+# sessions and the SQLite stores behind them.
+
+
+def lazy_singleton(factory):
+    """
+    Decorator turning a zero-argument factory into a getter that builds the object on the first call
+    and returns the same one afterwards. Threads racing for the first call build it once; a factory
+    that raises leaves nothing cached, so the next call tries again.
+    """
+    lock = threading.Lock()
+    instance = None
+
+    @functools.wraps(factory)
+    def get():
+        nonlocal instance
+        if instance is None:
+            with lock:
+                if instance is None:
+                    instance = factory()
+        return instance
+    return get
+
+
+def open_sqlite(path: str, *schema: str) -> sqlite3.Connection:
+    """
+    Connection usable from any thread (callers serialize access with their own lock) in WAL mode, so
+    other processes can keep reading while one writes. Creates the parent directory and runs the
+    schema statements (CREATE ... IF NOT EXISTS) before returning.
+    """
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    for statement in schema:
+        conn.execute(statement)
+    conn.commit()
+    return conn
@@ -0,0 +1,479 @@
+import csv
+import io
+import os
+import sys
+import threading
+import numpy as np
+import pandas as pd
+from EmbeddingStore import EmbeddingStore, text_ids
+from FeedbackArchive import ARCHIVE_DIR
+from SharedResources import lazy_singleton
+
+# Nearest-neighbour search over the MiniLM review embeddings in data/embeddings.
+# IVF layout: reviews are bucketed under k-means centroids and each bucket's vectors are stored
+# contiguously, so a query scores nprobe centroids and then only the reviews in those buckets.
+STORE_DIR = "data/embeddings"
+INDEX_DIR = os.path.join(STORE_DIR, "ivf")
+CATALOG_PATH = os.path.join(STORE_DIR, "catalog.csv")
+TRAIN_PATH = "data/train.txt"
+EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+TILE_SIZE = 65536
+BLOCK_SIZE = 8 << 20  # catalogue bytes parsed per step
+
+
+def normalize(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+def nearest_centroid(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    return np.argmax(vectors @ centroids.T, axis=1)
+
+def spherical_kmeans(sample: np.ndarray, n_clusters: int, iters=10, seed=0) -> np.ndarray:
+    """Unit-length centroids maximising cosine similarity to their members."""
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), n_clusters, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.concatenate([nearest_centroid(sample[s:s + TILE_SIZE], centroids)
+                                 for s in range(0, len(sample), TILE_SIZE)])
+        counts = np.bincount(assign, minlength=n_clusters)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        empty = counts == 0
+        sums = np.zeros_like(centroids)
+        sums[~empty] = np.add.reduceat(sample[np.argsort(assign, kind="stable")], starts[~empty], axis=0)
+        # reseed empty clusters from random members instead of letting them die
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+        centroids = normalize(sums)
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file index over a subset of EmbeddingStore rows.
+
+    On disk (INDEX_DIR):
+      centroids.npy  (n_lists, dim) float32
+      offsets.npy    bucket c holds positions offsets[c]:offsets[c + 1]
+      rows.npy       store row of every position, bucket by bucket
+      vectors.npy    normalised float16 vectors in the same order, memory-mapped at query time
+    """
+
+    def __init__(self, centroids, offsets, rows, vectors):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.rows = rows
+        self.vectors = vectors
+
+    @classmethod
+    def build(cls, store: EmbeddingStore, rows: np.ndarray, path=INDEX_DIR, n_lists=None,
+              sample_size=None, seed=0) -> "IVFIndex":
+        rows = np.unique(rows)
+        if not len(rows):
+            raise ValueError("nothing to index; catalogue some reviews first")
+        matrix = store.matrix()
+        n_lists = min(len(rows), n_lists or int(min(4096, max(1, 4 * np.sqrt(len(rows))))))
+        sample_size = min(len(rows), sample_size or 64 * n_lists)
+        sample = np.random.default_rng(seed).choice(rows, sample_size, replace=False)
+        centroids = spherical_kmeans(normalize(matrix[np.sort(sample)]), n_lists, seed=seed)
+
+        assign = np.concatenate([nearest_centroid(normalize(matrix[rows[s:s + TILE_SIZE]]), centroids)
+                                 for s in range(0, len(rows), TILE_SIZE)])
+        order = np.argsort(assign, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=n_lists))])
+        os.makedirs(path, exist_ok=True)
+        vectors = np.lib.format.open_memmap(os.path.join(path, "vectors.npy.tmp"), mode="w+",
+                                            dtype=np.float16, shape=(len(rows), store.dim))
+        for s in range(0, len(order), TILE_SIZE):
+            vectors[s:s + TILE_SIZE] = normalize(matrix[rows[order[s:s + TILE_SIZE]]])
+        vectors.flush()
+        del vectors
+        np.save(os.path.join(path, "centroids.npy"), centroids)
+        np.save(os.path.join(path, "offsets.npy"), offsets)
+        np.save(os.path.join(path, "rows.npy"), rows[order])
+        os.replace(os.path.join(path, "vectors.npy.tmp"), os.path.join(path, "vectors.npy"))
+        return cls.load(path)
+
+    @classmethod
+    def load(cls, path=INDEX_DIR) -> "IVFIndex":
+        return cls(np.load(os.path.join(path, "centroids.npy")),
+                   np.load(os.path.join(path, "offsets.npy")),
+                   np.load(os.path.join(path, "rows.npy")),
+                   np.load(os.path.join(path, "vectors.npy"), mmap_mode="r"))
+
+    def candidates(self, query: np.ndarray, nprobe: int):
+        """(store rows, float32 vectors) of the nprobe buckets closest to one normalised query."""
+        nprobe = min(nprobe, len(self.centroids))
+        probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        spans = [(self.offsets[c], self.offsets[c + 1]) for c in probe if self.offsets[c + 1] > self.offsets[c]]
+        if not spans:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, len(query)), dtype=np.float32)
+        rows = np.concatenate([self.rows[a:b] for a, b in spans])
+        vectors = np.concatenate([self.vectors[a:b] for a, b in spans]).astype(np.float32)
+        return rows, vectors
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    if len(scores) <= k:
+        return np.argsort(-scores)
+    best = np.argpartition(-scores, k - 1)[:k]
+    return best[np.argsort(-scores[best])]
+
+
+def record_ends(data: bytes) -> np.ndarray:
+    """Positions of the newlines in data that end a CSV record, i.e. lie outside a quoted field."""
+    buf = np.frombuffer(data, dtype=np.uint8)
+    # quote parity; a uint8 running count wraps at 256 but keeps its parity
+    quoted = np.cumsum(buf == ord('"'), dtype=np.uint8) & 1
+    return np.flatnonzero((buf == ord("\n")) & (quoted == 0))
+
+def pair_keys(ids, codes) -> np.ndarray:
+    """64-bit key of each (id, seller code): the id's leading 64 bits (ids are sha1 hex) mixed with the code."""
+    keys = np.frombuffer(bytes.fromhex("".join(i[:16] for i in ids)), dtype=">u8").astype(np.uint64)
+    return keys ^ (np.asarray(codes, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15))
+
+
+class Catalog:
+    """
+    Which review text (and seller, when known) each store id stands for; CATALOG_PATH is append-only.
+    Per entry only numpy arrays are kept: the byte offset of its record, its seller code and an (id, seller)
+    key for deduplication. Texts stay on disk and texts() reads back the few a query returns.
+    refresh() streams the records appended since the last call, including other processes' additions,
+    BLOCK_SIZE bytes at a time, and drain() hands the ids of the entries read so far to the searcher.
+    """
+
+    COLUMNS = ["id", "seller", "source", "text"]
+
+    def __init__(self, path=CATALOG_PATH):
+        self.path = path
+        self.sellers = [""]  # seller code -> name; 0 means no seller
+        self._codes = {"": 0}
+        self.offsets = np.zeros(0, dtype=np.int64)       # entry -> byte offset of its record
+        self.seller_codes = np.zeros(0, dtype=np.int32)  # entry -> seller code
+        self._keys = np.zeros(0, dtype=np.uint64)        # entry -> pair_keys(id, seller)
+        self._offset = 0   # bytes of the file read so far
+        self._pending = []
+        self._drained = 0
+        self.refresh()
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def _code(self, seller: str) -> int:
+        if seller not in self._codes:
+            self._codes[seller] = len(self.sellers)
+            self.sellers.append(seller)
+        return self._codes[seller]
+
+    def _blocks(self):
+        """(file offset, bytes, record ends) of the complete records appended since the last read."""
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            start, carry = self._offset, b""
+            while chunk := f.read(BLOCK_SIZE):
+                data = carry + chunk
+                ends = record_ends(data)
+                if not len(ends):
+                    carry = data
+                    continue
+                cut = ends[-1] + 1
+                yield start, data[:cut], ends
+                start, carry = start + cut, data[cut:]
+        # whatever is left in carry is a record still being written; it waits for the next refresh
+
+    def refresh(self) -> int:
+        """Read entries appended since the last call; returns how many."""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == self._offset:
+            return 0
+        before = len(self.offsets)
+        offsets, codes, keys = [self.offsets], [self.seller_codes], [self._keys]
+        for start, block, ends in self._blocks():
+            starts = start + np.concatenate([[0], ends[:-1] + 1])
+            df = pd.read_csv(io.BytesIO(block), dtype=str, keep_default_na=False, header=None,
+                             names=self.COLUMNS, usecols=["id", "seller"])
+            if start == 0:  # header line
+                starts, df = starts[1:], df.iloc[1:]
+            block_codes, names = pd.factorize(df["seller"])
+            block_codes = np.array([self._code(s) for s in names], dtype=np.int32)[block_codes]
+            offsets.append(starts)
+            codes.append(block_codes)
+            keys.append(pair_keys(df["id"], block_codes))
+            self._pending.extend(df["id"])
+            self._offset = start + len(block)
+        self.offsets, self.seller_codes, self._keys = (np.concatenate(a) for a in (offsets, codes, keys))
+        return len(self.offsets) - before
+
+    def drain(self) -> tuple[int, list[str]]:
+        """(first entry, ids) of the entries read since the last drain."""
+        first, pending = self._drained, self._pending
+        self._pending, self._drained = [], first + len(pending)
+        return first, pending
+
+    def texts(self, entries) -> list[str]:
+        """Review text of each entry, read back from its record."""
+        texts = []
+        with open(self.path, "rb") as f:
+            for entry in entries:
+                f.seek(self.offsets[entry])
+                record = f.readline()
+                while record.count(b'"') % 2 and (line := f.readline()):
+                    record += line
+                texts.append(next(csv.reader(io.StringIO(record.decode("utf-8"), newline="")))[3])
+        return texts
+
+    def add(self, ids, texts, seller="", source="") -> int:
+        """Append (id, seller) pairs not catalogued yet; returns how many were new."""
+        self.refresh()
+        new = pd.DataFrame({"id": ids, "seller": seller or "", "source": source or "", "text": texts})
+        new = new.drop_duplicates(["id", "seller"])
+        new = new[~np.isin(pair_keys(new["id"], np.full(len(new), self._code(seller or ""))), self._keys)]
+        if len(new):
+            new.to_csv(self.path, mode="a", header=not os.path.exists(self.path), index=False)
+            self.refresh()
+        return len(new)
+
+
+class SimilarComplaints:
+    """
+    Top-k similar reviews, or the sellers they belong to, for a comment or issue text.
+    Besides the catalogue's arrays only the store row of each catalogue entry is held, so memory stays a
+    few bytes per review: a query scores vectors, maps the hit rows back to their entries and reads just
+    those texts from the catalogue. refresh() picks up reviews catalogued and indexes rebuilt by other
+    processes (the CLI) since the last call.
+    """
+
+    def __init__(self, store_dir=STORE_DIR, index_dir=INDEX_DIR, catalog_path=CATALOG_PATH, model_name=EMBED_MODEL):
+        self.store = EmbeddingStore(store_dir)
+        self.catalog = Catalog(catalog_path)
+        self.model_name = model_name
+        self.index_dir = index_dir
+        self._model = None
+        self._lock = threading.Lock()
+        self.entry_rows = np.zeros(0, dtype=np.int64)  # catalogue entry -> store row, -1 until it is stored
+        self._waiting = {}   # entry -> id, for entries whose vectors another process hasn't appended yet
+        self._by_row = None  # (entries sorted by store row, their rows), built by the first query after a change
+        self._tail = (np.zeros(0, dtype=np.int64), np.zeros((0, self.store.dim), dtype=np.float32))
+        self.index = None
+        self._index_stamp = None
+        self.refresh()
+
+    @property
+    def tail(self) -> np.ndarray:
+        return self._tail[0]
+
+    def _index_changed(self) -> bool:
+        # vectors.npy is replaced last by IVFIndex.build, so its mtime stamps a complete index
+        path = os.path.join(self.index_dir, "vectors.npy")
+        stamp = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+        if stamp == self._index_stamp:
+            return False
+        self.index = IVFIndex.load(self.index_dir) if stamp is not None else None
+        self._index_stamp = stamp
+        return True
+
+    def refresh(self):
+        with self._lock:
+            self._refresh_tail(full=self._index_changed())
+
+    def _store_row(self, id_: str) -> int:
+        row = self.store.row_of(id_)
+        return -1 if row is None else row
+
+    def _refresh_tail(self, full=False):
+        # catalogued rows the index hasn't seen yet (added since the last build) are scored exhaustively;
+        # their normalised vectors are kept here so queries never rebuild them
+        grew = self.store.refresh()
+        self.catalog.refresh()
+        first, ids = self.catalog.drain()
+        if not (full or ids or (grew and self._waiting)):
+            return
+        new_rows = np.fromiter((self._store_row(i) for i in ids), dtype=np.int64, count=len(ids))
+        entry_rows = np.concatenate([self.entry_rows, new_rows])
+        for entry, id_ in list(self._waiting.items()):
+            row = self._store_row(id_)
+            if row >= 0:
+                entry_rows[entry] = row
+                new_rows = np.append(new_rows, row)
+                del self._waiting[entry]
+        self._waiting.update((first + n, ids[n]) for n in np.flatnonzero(entry_rows[first:] < 0))
+        self.entry_rows, self._by_row = entry_rows, None
+        if full:
+            rows = self.catalogued()
+        else:
+            rows = np.unique(new_rows[new_rows >= 0])
+            rows = rows[~np.isin(rows, self._tail[0])]
+            if not len(rows):
+                return
+        indexed = self.index.rows if self.index is not None else np.zeros(0, dtype=np.int64)
+        rows = rows[~np.isin(rows, indexed)]
+        vectors = normalize(self.store.matrix()[rows]) if len(rows) else np.zeros((0, self.store.dim), dtype=np.float32)
+        if not full:
+            rows = np.concatenate([self._tail[0], rows])
+            vectors = np.concatenate([self._tail[1], vectors])
+        self._tail = (rows, vectors)
+
+    def catalogued(self) -> np.ndarray:
+        """Sorted store rows of every catalogued review whose vector is stored."""
+        return np.unique(self.entry_rows[self.entry_rows >= 0])
+
+    def _entries(self, rows) -> list[np.ndarray]:
+        """Catalogue entries of each store row (one per seller it was catalogued under)."""
+        if self._by_row is None:
+            order = np.argsort(self.entry_rows, kind="stable")
+            self._by_row = (order, self.entry_rows[order])
+        order, sorted_rows = self._by_row
+        lo, hi = np.searchsorted(sorted_rows, rows, "left"), np.searchsorted(sorted_rows, rows, "right")
+        return [order[a:b] for a, b in zip(lo, hi)]
+
+    def _sellers(self, entries: np.ndarray) -> list[str]:
+        return sorted({self.catalog.sellers[c] for c in self.catalog.seller_codes[entries]} - {""})
+
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        """Normalised query vectors; a query that is itself a stored review reuses its vector."""
+        rows = [self.store.row_of(i) for i in text_ids(self.model_name, texts)]
+        if all(r is not None for r in rows):
+            return normalize(self.store.matrix()[rows])
+        return normalize(self.model().encode(texts, convert_to_numpy=True))
+
+    def add_reviews(self, texts: list[str], seller="", source="") -> int:
+        """Embed and catalogue reviews (e.g. a scraped test.csv); they are searchable immediately."""
+        texts = [str(t) for t in texts if str(t).strip()]
+        ids = text_ids(self.model_name, texts)
+        self.store.ensure(ids, texts, lambda t: self.model().encode(t, convert_to_numpy=True, show_progress_bar=True))
+        added = self.catalog.add(ids, texts, seller=seller, source=source)
+        self.refresh()
+        return added
+
+    def rebuild(self, **kwargs) -> IVFIndex:
+        with self._lock:
+            self._refresh_tail()
+            IVFIndex.build(self.store, self.catalogued(), self.index_dir, **kwargs)
+            self._index_changed()
+            self._refresh_tail(full=True)
+        return self.index
+
+    def search_rows(self, text: str, k=10, nprobe=NPROBE):
+        """(store rows, cosine scores) of the k nearest catalogued reviews, best first."""
+        query = self.embed([text])[0]
+        if self.index is not None:
+            rows, vectors = self.index.candidates(query, nprobe)
+        else:
+            rows, vectors = np.zeros(0, dtype=np.int64), np.zeros((0, len(query)), dtype=np.float32)
+        tail_rows, tail_vectors = self._tail
+        if len(tail_rows):
+            rows = np.concatenate([rows, tail_rows])
+            vectors = np.concatenate([vectors, tail_vectors])
+        scores = vectors @ query
+        best = top_k(scores, k)
+        return rows[best], scores[best]
+
+    def similar_reviews(self, text: str, k=10, nprobe=NPROBE) -> pd.DataFrame:
+        rows, scores = self.search_rows(text, k, nprobe)
+        # a row another process indexed before this searcher read its catalogue entry has none yet
+        entries = self._entries(rows)
+        found = [n for n, e in enumerate(entries) if len(e)]
+        entries, scores = [entries[n] for n in found], scores[found]
+        return pd.DataFrame({"score": scores.round(4),
+                             "text": self.catalog.texts(e[0] for e in entries),
+                             "sellers": [", ".join(self._sellers(e)) for e in entries]})
+
+    def similar_sellers(self, text: str, k=10, hits=200, nprobe=NPROBE) -> pd.DataFrame:
+        """Sellers ranked by how many of the nearest `hits` reviews are theirs, then by best score."""
+        rows, scores = self.search_rows(text, hits, nprobe)
+        ranked = {}  # seller -> [matches, best score, entry of the best match]; rows come best first
+        for entries, score in zip(self._entries(rows), scores):
+            for seller in self._sellers(entries):
+                if seller not in ranked:
+                    ranked[seller] = [0, round(float(score), 4), entries[0]]
+                ranked[seller][0] += 1
+        result = pd.DataFrame([(seller, *stats) for seller, stats in ranked.items()],
+                              columns=["seller", "matches", "best_score", "entry"])
+        result = result.sort_values(["matches", "best_score"], ascending=False).head(k).reset_index(drop=True)
+        # only the examples shown are read back from the catalogue
+        result["example"] = self.catalog.texts(result.pop("entry"))
+        return result
+
+
+@lazy_singleton
+def _shared_search() -> SimilarComplaints:
+    return SimilarComplaints()
+
+def get_search() -> SimilarComplaints:
+    """The API's searcher, brought up to date with the CLI's additions and rebuilds on every call."""
+    search = _shared_search()
+    # cheap when nothing changed: two file sizes and the index mtime
+    search.refresh()
+    return search
+
+
+def catalogue_sources(search: SimilarComplaints, train_path=TRAIN_PATH, archive_dir=ARCHIVE_DIR) -> int:
+    """
+    Catalogue the training reviews (no seller) and every seller's scraped feedback archive under that
+    seller, embedding only texts the store hasn't seen; returns how many entries were new.
+    """
+    added = 0
+    if os.path.exists(train_path):
+        train = pd.read_csv(train_path, sep="\t", header=None, names=["text"], dtype=str, keep_default_na=False)
+        added += search.add_reviews(train["text"].tolist(), source="train")
+    if os.path.isdir(archive_dir):
+        for name in sorted(os.listdir(archive_dir)):
+            if name.endswith(".csv"):
+                rows = pd.read_csv(os.path.join(archive_dir, name), usecols=["comment"], dtype=str,
+                                   keep_default_na=False)
+                added += search.add_reviews(rows["comment"].tolist(), seller=name[:-len(".csv")], source="archive")
+    return added
+
+
+def main():
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(description="Similar-complaint search over the review embedding store")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="catalogue the training reviews and the scraped seller archive, "
+                                         "then (re)build the IVF index over every catalogued review")
+    build.add_argument("--lists", type=int, default=None, help="number of buckets (default 4*sqrt(rows))")
+    build.add_argument("--train", default=TRAIN_PATH, help="training reviews, one per line")
+    build.add_argument("--archive", default=ARCHIVE_DIR, help="per-seller feedback archive (FeedbackArchive.py)")
+    add = sub.add_parser("add", help="embed and catalogue a CSV of reviews, e.g. a scraped test.csv")
+    add.add_argument("csv")
+    add.add_argument("--seller", default="", help="seller the reviews belong to")
+    query = sub.add_parser("query", help="top-k reviews or sellers for a comment/issue text")
+    query.add_argument("text")
+    query.add_argument("-k", type=int, default=10)
+    query.add_argument("--nprobe", type=int, default=NPROBE)
+    query.add_argument("--sellers", action="store_true", help="rank sellers instead of reviews")
+    args = parser.parse_args()
+
+    search = SimilarComplaints()
+    if args.command == "build":
+        start = time.perf_counter()
+        added = catalogue_sources(search, args.train, args.archive)
+        print(f"🧮 Catalogued {added} new reviews")
+        index = search.rebuild(n_lists=args.lists)
+        print(f"✅ Indexed {len(index.rows)} reviews into {len(index.centroids)} buckets "
+              f"in {time.perf_counter() - start:.1f}s ({INDEX_DIR})")
+    elif args.command == "add":
+        df = pd.read_csv(args.csv)
+        col = "comment" if "comment" in df.columns else "text"
+        added = search.add_reviews(df[col].dropna().tolist(), seller=args.seller, source=os.path.basename(args.csv))
+        print(f"🧮 Catalogued {added} new reviews; {len(search.tail)} await the next build")
+    else:
+        search.embed([args.text])  # load the model outside the timing
+        start = time.perf_counter()
+        if args.sellers:
+            result = search.similar_sellers(args.text, k=args.k, nprobe=args.nprobe)
+        else:
+            result = search.similar_reviews(args.text, k=args.k, nprobe=args.nprobe)
+        elapsed = time.perf_counter() - start
+        with pd.option_context("display.max_colwidth", 80, "display.width", 200):
+            print(result.to_string(index=False))
+        print(f"⏱️ {1000 * elapsed:.1f} ms")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
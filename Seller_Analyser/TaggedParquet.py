@@ -0,0 +1,112 @@
+import os
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet output is optional, CSV keeps working without pyarrow
+    pa = pq = None
+
+# Columnar form of the tagged feedback/review tables: issues stay a real list<string> column instead
+# of a stringified Python list, and low-cardinality text columns are dictionary-encoded.
+LIST_COLUMNS = ("issues",)
+DICTIONARY_COLUMNS = ("final_sentiment", "rating_type", "label")
+
+
+def parquet_path(path: str) -> str:
+    """test.csv -> test.parquet"""
+    return os.path.splitext(path)[0] + ".parquet"
+
+def _require_pyarrow():
+    if pq is None:
+        raise ImportError("Parquet output needs pyarrow (pip install pyarrow)")
+
+def as_list(issues) -> list:
+    if isinstance(issues, (list, tuple, np.ndarray)):
+        return [str(i) for i in issues]
+    if issues is None or (isinstance(issues, float) and np.isnan(issues)) or issues == "":
+        return []
+    return [i.strip() for i in str(issues).split(",") if i.strip()]
+
+def _schema_for(table):
+    fields = []
+    for f in table.schema:
+        if f.name in LIST_COLUMNS:
+            f = pa.field(f.name, pa.list_(pa.string()))
+        elif f.name in DICTIONARY_COLUMNS:
+            f = pa.field(f.name, pa.dictionary(pa.int32(), pa.string()))
+        fields.append(f)
+    return pa.schema(fields)
+
+def to_table(df: pd.DataFrame, schema=None):
+    """Arrow table for a tagged frame; pass the first chunk's schema to keep later chunks identical."""
+    _require_pyarrow()
+    df = df.copy()
+    lists = [c for c in LIST_COLUMNS if c in df.columns]
+    for col in DICTIONARY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("string").astype("category")
+    table = pa.Table.from_pandas(df.drop(columns=lists), preserve_index=False).replace_schema_metadata(None)
+    for col in lists:
+        values = pa.array([as_list(v) for v in df[col]], type=pa.list_(pa.string()))
+        table = table.add_column(df.columns.get_loc(col), col, values)
+    return table.cast(schema or _schema_for(table))
+
+
+class TaggedWriter:
+    """Append frames to one Parquet file as row groups; the file appears at path only on close()."""
+
+    def __init__(self, path: str):
+        _require_pyarrow()
+        self.path = path
+        self.tmp_path = path + ".partial"
+        self._writer = None
+        self.rows = 0
+
+    def write(self, df: pd.DataFrame):
+        table = to_table(df, self._writer.schema if self._writer else None)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.tmp_path, table.schema)
+        self._writer.write_table(table)
+        self.rows += len(df)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            os.replace(self.tmp_path, self.path)
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *_):
+        if exc_type is None:
+            self.close()
+        elif self._writer is not None:
+            # a failed write leaves neither a half-written file at path nor the .partial behind
+            self._writer.close()
+            self._writer = None
+            os.remove(self.tmp_path)
+
+
+def write_tagged(df: pd.DataFrame, path: str):
+    with TaggedWriter(path) as writer:
+        writer.write(df)
+
+def read_tagged(path: str, columns=None) -> pd.DataFrame:
+    """
+    Memory-mapped read of just the requested columns (missing ones are skipped).
+    issues comes back as Python lists, dictionary columns as pandas categoricals.
+    """
+    _require_pyarrow()
+    if columns is not None:
+        names = set(pq.read_schema(path).names)
+        columns = [c for c in columns if c in names]
+    table = pq.read_table(path, columns=columns, memory_map=True)
+    lists = [c for c in LIST_COLUMNS if c in table.column_names]
+    df = table.drop(lists).to_pandas()
+    for col in lists:
+        # straight to Python lists; to_pandas would give one numpy array per row
+        df[col] = [v or [] for v in table.column(col).to_pylist()]
+    return df[table.column_names]
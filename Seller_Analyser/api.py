@@ -5,9 +5,15 @@ import requests
 import re
 from typing import Optional
 from bs4 import BeautifulSoup
-import subprocess
 import sys
 import os
+import threading
+import traceback
+import AIAnalysis
+import CombinedFeedback
+import DriverPool
+import SimilarityIndex
+import TaggedParquet
 
 
 # Print Python executable for environment debugging
@@ -27,6 +33,37 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# processes for the analysis rule pass, same as AIAnalysis.py --workers
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "1"))
+# tagged feedback is handed over as test.csv; "parquet" (needs pyarrow) uses test.parquet with issues as a real list
+ANALYSIS_FORMAT = os.getenv("ANALYSIS_FORMAT", "csv")
+# the only test.parquet columns /analyze-seller reads
+FEEDBACK_COLUMNS = ["comment", "rating_type", "date", "issues", "final_sentiment"]
+
+# browsers started at startup for scrapes the HTTP engine has to hand to Selenium; the browser is a rare
+# fallback, so by default the pool starts its first one on demand
+DRIVER_POOL_WARM = int(os.getenv("DRIVER_POOL_WARM", "0"))
+# /analyze-seller scrapes into test.csv, analyses it in place and reads it back (and shares the one
+# zero-shot pipeline), so a request holds this from its scrape until its results are read
+SCRAPE_LOCK = threading.Lock()
+
+@app.on_event("startup")
+def warm_up_analysis():
+    # Load the zero-shot model in the background so the first /analyze-seller doesn't pay for it
+    threading.Thread(target=AIAnalysis.warm_up, daemon=True).start()
+    if DRIVER_POOL_WARM:
+        threading.Thread(target=warm_up_drivers, daemon=True).start()
+
+def warm_up_drivers():
+    try:
+        DriverPool.get_driver_pool().warm_up(DRIVER_POOL_WARM)
+    except Exception as e:
+        print(f"[API] Could not start a browser for the driver pool: {e}")
+
+@app.on_event("shutdown")
+def close_driver_pool():
+    DriverPool.get_driver_pool().close()
+
 @app.get("/health")
 def health_check():
     print("Health check called! - FORCED RELOAD V2")
@@ -61,6 +98,19 @@ def test_search(product: str):
     debug_info.append(f"Returning result: {result}")
     return result
 
+@app.get("/similar-complaints")
+def similar_complaints(q: str, k: int = 10, by: str = "reviews"):
+    """Top-k reviews (by=reviews) or sellers (by=sellers) whose feedback reads most like q."""
+    try:
+        search = SimilarityIndex.get_search()
+    except FileNotFoundError as e:
+        return {"error": f"No review embeddings yet, run convertToMultiLabel.py and `SimilarityIndex.py build` first: {e}"}
+    if by == "sellers":
+        result = search.similar_sellers(q, k=k)
+    else:
+        result = search.similar_reviews(q, k=k)
+    return {"query": q, "by": by, "results": result.to_dict(orient="records")}
+
 class AnalyseRequest(BaseModel):
     product: Optional[str] = None
     ebay_link: Optional[str] = None
@@ -281,41 +331,56 @@ def get_feedback_v1(username, limit=5):
 
 @app.post("/analyze-seller")
 def analyze_seller(req: AnalyseRequest):
+    with SCRAPE_LOCK:
+        return _analyze_seller(req)
+
+def _analyze_seller(req: AnalyseRequest):
     import pandas as pd
     debug_info = []
     debug_info.append(f"=== ANALYZE SELLER CALLED ===")
     print(f"[API] /analyze-seller called with: {req}")
 
-    # Run CombinedFeedback.py synchronously to scrape feedback for the given eBay link
+    # Scrape feedback for the given eBay link in-process, on the shared HTTP session / driver pool
     if req.ebay_link:
-        print(f"[API] Running CombinedFeedback.py for link: {req.ebay_link}")
-        result_scrape = subprocess.run([sys.executable, "CombinedFeedback.py", req.ebay_link], cwd=".", capture_output=True, text=True)
-        print(f"[API] CombinedFeedback.py output: {result_scrape.stdout}")
-        print(f"[API] CombinedFeedback.py stderr: {result_scrape.stderr}")
+        print(f"[API] Running CombinedFeedback for link: {req.ebay_link}")
+        scrape_stderr = ""
+        # only this request's scrape log: the other request threads and the warm-up keep their stdout
+        with CombinedFeedback.capture_log() as scrape_log:
+            try:
+                CombinedFeedback.scrape_to_csv(req.ebay_link, "test.csv")
+                scrape_failed = False
+            except Exception:
+                scrape_stderr = traceback.format_exc()
+                scrape_failed = True
+        scrape_stdout = "\n".join(scrape_log)
+        print(f"[API] CombinedFeedback output: {scrape_stdout}")
+        print(f"[API] CombinedFeedback stderr: {scrape_stderr}")
         # Log to file for debugging
         with open("combinedfeedback_api_debug.log", "w", encoding="utf-8") as f:
-            f.write("STDOUT:\n" + result_scrape.stdout + "\n\nSTDERR:\n" + result_scrape.stderr)
+            f.write("STDOUT:\n" + scrape_stdout + "\n\nSTDERR:\n" + scrape_stderr)
         def summarize_output(out):
             lines = out.splitlines()
             if len(lines) > 30:
                 return '\n'.join(lines[:10] + ["... (output truncated) ..."] + lines[-10:])
             return out
-        combined_output = summarize_output(result_scrape.stdout)
-        combined_error = summarize_output(result_scrape.stderr)
-        if result_scrape.returncode != 0:
+        combined_output = summarize_output(scrape_stdout)
+        combined_error = summarize_output(scrape_stderr)
+        if scrape_failed:
             return {"error": "Failed to scrape feedback.", "details": combined_error, "output": combined_output}
         if not combined_output.strip() and not combined_error.strip():
-            return {"warning": "CombinedFeedback.py ran but produced no output or error.", "output": combined_output, "stderr": combined_error}
+            return {"warning": "CombinedFeedback ran but produced no output or error.", "output": combined_output, "stderr": combined_error}
 
-        # If scraping succeeded, run AIAnalysis.py
-        print(f"[API] Running AIAnalysis.py for analysis...")
-        result_analysis = subprocess.run([sys.executable, "AIAnalysis.py"], cwd=".", capture_output=True, text=True)
-        print(f"[API] AIAnalysis.py output: {result_analysis.stdout}")
-        with open("aianalysis_api_debug.log", "w", encoding="utf-8") as f:
-            f.write("STDOUT:\n" + result_analysis.stdout + "\n\nSTDERR:\n" + result_analysis.stderr)
-        analysis_output = summarize_output(result_analysis.stdout)
-        analysis_error = summarize_output(result_analysis.stderr)
-        if result_analysis.returncode != 0:
+        # If scraping succeeded, run the analysis in-process so the warmed-up model is reused
+        print(f"[API] Running AIAnalysis for analysis...")
+        try:
+            _, analysis_summary, _ = AIAnalysis.analyze_csv("test.csv", workers=ANALYSIS_WORKERS,
+                                                             fmt=ANALYSIS_FORMAT)
+            analysis_output = summarize_output(analysis_summary.to_string())
+            analysis_error = ""
+        except Exception:
+            analysis_error = summarize_output(traceback.format_exc())
+            with open("aianalysis_api_debug.log", "w", encoding="utf-8") as f:
+                f.write("STDERR:\n" + analysis_error)
             return {
                 "error": "Failed to analyze feedback.",
                 "scrape_output": combined_output,
@@ -323,10 +388,13 @@ def analyze_seller(req: AnalyseRequest):
                 "analysis_stderr": analysis_error
             }
 
-        # Parse test.csv for summary stats and recent feedbacks
+        # Parse test.parquet (or test.csv) for summary stats and recent feedbacks
         try:
-            # After AIAnalysis.py, reload test.csv to get issues/final_sentiment columns
-            df = pd.read_csv("test.csv")
+            if ANALYSIS_FORMAT == "parquet":
+                df = TaggedParquet.read_tagged("test.parquet", columns=FEEDBACK_COLUMNS)
+            else:
+                # After AIAnalysis.py, reload test.csv to get issues/final_sentiment columns
+                df = pd.read_csv("test.csv")
             # If issues/final_sentiment not present, try to load from negative_reviews.csv or fallback
             if not ("issues" in df.columns and "final_sentiment" in df.columns):
                 # Try to load from negative_reviews.csv (should have those columns)
@@ -351,7 +419,7 @@ def analyze_seller(req: AnalyseRequest):
             if "issues" in df.columns and "final_sentiment" in df.columns:
                 summary = (
                     df.explode("issues")
-                    .groupby(["issues", "final_sentiment"])
+                    .groupby(["issues", "final_sentiment"], observed=True)
                     .size()
                     .reset_index(name="count")
                     .sort_values("count", ascending=False)
@@ -1,59 +1,110 @@
 import os
 import pandas as pd
+import numpy as np
 import torch
 from sentence_transformers import SentenceTransformer, util
-from tqdm import tqdm
-
-# 1. Load data
-df_train = pd.read_csv("data/train.txt", sep="\t", header=None, names=["text"])
-review_texts = df_train["text"].tolist()
-
-# 2. Define issue descriptions
-issue_descriptions = {
-    "late_delivery": "The item arrived later than expected.",
-    "poor_packaging": "The packaging was damaged or insufficient.",
-    "wrong_item": "The item received was not what was ordered.",
-    "low_quality": "The product quality was worse than expected.",
-    "no_communication": "The seller did not respond to messages.",
-    "refund_problem": "Issues with getting a refund or return.",
-}
-issue_texts = list(issue_descriptions.values())
-issue_keys = list(issue_descriptions.keys())
-
-# 3. Load model
-model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-
-# 4. Load or encode issue embeddings
-if os.path.exists("data/issue_embeddings.pt"):
-    issue_embeddings = torch.load("data/issue_embeddings.pt")
-else:
-    issue_embeddings = model.encode(issue_texts, convert_to_tensor=True)
-    torch.save(issue_embeddings, "data/issue_embeddings.pt")
-
-# 5. Load or encode review embeddings
-if os.path.exists("data/review_embeddings.pt"):
-    review_embeddings = torch.load("data/review_embeddings.pt")
-else:
-    review_embeddings = model.encode(
-        review_texts,
-        batch_size=128,
-        convert_to_tensor=True,
-        show_progress_bar=True
-    )
-    torch.save(review_embeddings, "data/review_embeddings.pt")
-
-# 6. Compute cosine similarity matrix
-similarity_matrix = util.cos_sim(review_embeddings, issue_embeddings)
-
-# 7. Tag reviews based on threshold
-threshold = 0.4
-tags = []
-for row in tqdm(similarity_matrix, desc="🔖 Tagging reviews"):
-    matched = [issue_keys[i] for i, score in enumerate(row) if score > threshold]
-    tags.append(matched)
-
-df_train["issues"] = tags
-
-# 8. Save results
-df_train.to_csv("data/train_tagged.csv", index=False)
-print("✅ Done! Tagged 3.6M reviews and saved embeddings.")
+from EmbeddingStore import EmbeddingStore, text_ids
+from TaggedParquet import TaggedWriter
+from EncoderPool import EncoderPool
+
+def main():
+    # 1. Load data
+    df_train = pd.read_csv("data/train.txt", sep="\t", header=None, names=["text"])
+    review_texts = df_train["text"].tolist()
+
+    # 2. Define issue descriptions
+    issue_descriptions = {
+        "late_delivery": "The item arrived later than expected.",
+        "poor_packaging": "The packaging was damaged or insufficient.",
+        "wrong_item": "The item received was not what was ordered.",
+        "low_quality": "The product quality was worse than expected.",
+        "no_communication": "The seller did not respond to messages.",
+        "refund_problem": "Issues with getting a refund or return.",
+    }
+    issue_texts = list(issue_descriptions.values())
+    issue_keys = list(issue_descriptions.keys())
+
+    # 3. Load model
+    model_name = "sentence-transformers/all-MiniLM-L6-v2"
+    model = SentenceTransformer(model_name)
+
+    # 4-5. Embeddings are content-addressed: id = sha1(model name, text), so editing issue_descriptions,
+    # switching models or adding reviews only encodes texts never seen before and stale rows are never reused
+    store = EmbeddingStore("data/embeddings", dim=model.get_sentence_embedding_dimension())
+
+    def encode(texts):
+        return model.encode(texts, batch_size=128, convert_to_numpy=True, show_progress_bar=True)
+
+    def ensure_embedded(texts, label, pool=None):
+        """Store rows for texts, encoding only the ones the store hasn't seen."""
+        ids = text_ids(model_name, texts)
+        if pool is None:
+            rows, encoded = store.ensure(ids, texts, encode)
+        else:
+            rows, encoded = store.ensure_stream(ids, texts, lambda new: sharded(pool, new))
+        print(f"🧮 {label}: encoded {encoded} new texts, reused {len(texts) - encoded} rows")
+        return rows
+
+    def sharded(pool, new_texts):
+        done = 0
+        for vectors in pool.imap(new_texts):
+            yield vectors
+            done += len(vectors)
+            print(f"📦 {done}/{len(new_texts)} encoded by {pool.workers} workers x {pool.threads} threads")
+
+    issue_rows = ensure_embedded(issue_texts, "Issue descriptions")
+    issue_embeddings = torch.from_numpy(store.matrix()[issue_rows].astype(np.float32))
+    # ENCODE_WORKERS > 1 shards review encoding over CPU processes with ENCODE_THREADS torch threads each.
+    # Shards are stored in order as they finish, so a rerun after an interruption resumes from the last one.
+    encode_workers = int(os.getenv("ENCODE_WORKERS", "1"))
+    if encode_workers > 1:
+        with EncoderPool(model_name, workers=encode_workers,
+                         threads=int(os.getenv("ENCODE_THREADS", "0")) or None) as pool:
+            review_rows = ensure_embedded(review_texts, "Reviews", pool)
+    else:
+        review_rows = ensure_embedded(review_texts, "Reviews")
+
+    # 6. Per-label thresholds (default 0.4) and the bit each issue sets in a review's issue_mask
+    default_threshold = 0.4
+    issue_thresholds = {key: default_threshold for key in issue_keys}
+    threshold_vec = torch.tensor([issue_thresholds[k] for k in issue_keys], dtype=issue_embeddings.dtype,
+                                 device=issue_embeddings.device)
+    bit_values = 1 << torch.arange(len(issue_keys), device=issue_embeddings.device)
+
+    def tag_tile(tile):
+        """issue_mask bitmask for one tile of review embeddings; only a tile x issues matrix is ever live."""
+        similarity = util.cos_sim(tile, issue_embeddings)
+        return ((similarity > threshold_vec).long() * bit_values).sum(dim=1).cpu()
+
+    # 7-8. Similarity, tagging and saving tile by tile so memory stays flat whatever the corpus size
+    tile_size = int(os.getenv("TILE_SIZE", "65536"))
+    # OUTPUT_FORMAT=parquet writes train_tagged.parquet with issues as a list column, one row group per tile
+    parquet = os.getenv("OUTPUT_FORMAT", "csv") == "parquet"
+    out_path = "data/train_tagged.parquet" if parquet else "data/train_tagged.csv"
+    writer = TaggedWriter(out_path) if parquet else None
+    label_lists = {}  # each distinct bitmask is decoded to a label list once
+    matrix = store.matrix()
+    for n, start in enumerate(range(0, len(review_rows), tile_size)):
+        # gathers just this tile's rows from the memory map, in train.txt order
+        tile = matrix[review_rows[start:start + tile_size]]
+        bitmask = tag_tile(torch.from_numpy(tile.astype(np.float32)))
+        for b in torch.unique(bitmask).tolist():
+            label_lists.setdefault(b, [issue_keys[i] for i in range(len(issue_keys)) if b >> i & 1])
+
+        tagged = df_train.iloc[start:start + len(bitmask)].copy()
+        tagged["issue_mask"] = bitmask.numpy()
+        tagged["issues"] = tagged["issue_mask"].map(label_lists)
+        if parquet:
+            writer.write(tagged)
+        else:
+            tagged.to_csv(out_path, mode="w" if n == 0 else "a", header=n == 0, index=False)
+        del tile, bitmask, tagged
+    if parquet:
+        writer.close()
+
+    print(f"✅ Done! Tagged {len(df_train)} reviews and saved embeddings.")
+    print("🔎 Run `python SimilarityIndex.py build` to catalogue them for the similar-complaint search.")
+
+
+if __name__ == "__main__":
+    main()
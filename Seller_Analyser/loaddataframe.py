@@ -1,18 +1,76 @@
+import os
+from itertools import islice
 import pandas as pd
 
-def load_fasttext_format(path):
-    texts= []
-    labels= []
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # no columnar cache without pyarrow, parsing still streams
+    pa = pq = None
+
+CHUNK_LINES = 500_000
+
+def iter_fasttext_chunks(path, chunk_lines=CHUNK_LINES):
+    """Yield DataFrames of up to chunk_lines parsed '__label__x text' lines, label as a categorical."""
     with open(path, 'r', encoding = 'utf-8') as f:
-        for line in f:
-            parts = line.strip().split(' ',1)
-            if len(parts) == 2:
-                label, text = parts
-                labels.append(label.replace('__label__',''))
-                texts.append(text)
-    return pd.DataFrame({'label': labels, 'text': texts})
-
-df_train = load_fasttext_format('data/train.txt')
-df_test = load_fasttext_format('data/test.txt')
-
-print(df_train.head())
\ No newline at end of file
+        while True:
+            lines = list(islice(f, chunk_lines))
+            if not lines:
+                break
+            labels = []
+            texts = []
+            for line in lines:
+                parts = line.strip().split(' ',1)
+                if len(parts) == 2:
+                    label, text = parts
+                    labels.append(label.replace('__label__',''))
+                    texts.append(text)
+            yield pd.DataFrame({'label': pd.Categorical(labels), 'text': texts})
+
+def cache_path(path):
+    return path + '.parquet'
+
+def _source_stamp(path):
+    st = os.stat(path)
+    return {b'source_size': str(st.st_size).encode(), b'source_mtime_ns': str(st.st_mtime_ns).encode()}
+
+def _cache_is_fresh(path):
+    cache = cache_path(path)
+    if not os.path.exists(cache):
+        return False
+    metadata = pq.read_schema(cache).metadata or {}
+    stamp = _source_stamp(path)
+    return all(metadata.get(k) == v for k, v in stamp.items())
+
+def _write_cache(path):
+    """Stream the source into a Parquet file next to it, one row group per chunk."""
+    schema = pa.schema([('label', pa.dictionary(pa.int32(), pa.string())), ('text', pa.string())],
+                       metadata=_source_stamp(path))
+    tmp = cache_path(path) + '.tmp'
+    with pq.ParquetWriter(tmp, schema) as writer:
+        for chunk in iter_fasttext_chunks(path):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+    os.replace(tmp, cache_path(path))
+
+def load_fasttext_format(path, columns=None, use_cache=True):
+    """
+    Load a fastText-format file as a DataFrame with a categorical 'label' and a 'text' column.
+    The first load writes <path>.parquet keyed by the source's size and mtime; later loads are
+    memory-mapped reads of that cache (optionally only some columns) until the source changes.
+    """
+    if use_cache and pq is not None:
+        if not _cache_is_fresh(path):
+            _write_cache(path)
+        return pq.read_table(cache_path(path), columns=columns, memory_map=True).to_pandas()
+    chunks = list(iter_fasttext_chunks(path))
+    if not chunks:
+        return pd.DataFrame({'label': pd.Categorical([]), 'text': []})[columns or ['label', 'text']]
+    df = pd.concat(chunks, ignore_index=True)
+    df['label'] = df['label'].astype('category')
+    return df[columns] if columns else df
+
+if __name__ == "__main__":
+    df_train = load_fasttext_format('data/train.txt')
+    df_test = load_fasttext_format('data/test.txt')
+
+    print(df_train.head())
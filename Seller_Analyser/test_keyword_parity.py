@@ -0,0 +1,100 @@
+import os
+import re
+import sys
+import warnings
+from difflib import SequenceMatcher
+
+import pandas as pd
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+warnings.filterwarnings("ignore", message="Using slow pure-python SequenceMatcher")
+from fuzzywuzzy import fuzz  # noqa: E402
+import AIAnalysis  # noqa: E402
+
+# Parity of KeywordMatcher against the per-keyword rule engine it replaced. The outputs differ on purpose
+# in two ways, and nowhere else:
+#   1. keywords are lowercased like the comment, so capitalised ones ("Prompt delivery", "I got refunded")
+#      can match at all; the old fuzz.partial_ratio(kw, text.lower()) never matched them
+#   2. an exact keyword hit no longer depends on difflib's autojunk, which on comments of 200+ characters
+#      treats common letters as junk and made partial_ratio miss phrases that are in the text verbatim
+DATASETS = [p for p in (os.path.join(HERE, "test.csv"), os.path.join(HERE, "..", "test.csv")) if os.path.exists(p)]
+RATINGS = ("Positive", "Negative", "Neutral")
+
+
+def has_negation_window(text, kw, max_gap=3):
+    pattern = rf"\b(?:no|not|never|without)\b(?:\W+\w+){{0,{max_gap}}}?\W*\b{re.escape(kw)}\b"
+    return re.search(pattern, text, flags=re.IGNORECASE) is not None
+
+def partial_ratio_no_autojunk(s1, s2):
+    """fuzz.partial_ratio (pure-python path) with difflib's autojunk heuristic turned off."""
+    shorter, longer = (s1, s2) if len(s1) <= len(s2) else (s2, s1)
+    if s1 == s2:
+        return 100
+    if not shorter:
+        return 0
+    scores = []
+    for a, b, _ in SequenceMatcher(None, shorter, longer, autojunk=False).get_matching_blocks():
+        start = max(b - a, 0)
+        r = SequenceMatcher(None, shorter, longer[start:start + len(shorter)], autojunk=False).ratio()
+        if r > .995:
+            return 100
+        scores.append(r)
+    return int(round(100 * max(scores)))
+
+def legacy_match_issues(text, original_rating, intended=False, threshold=95):
+    """The pre-KeywordMatcher match_issues_rule_based; intended=True applies only the two fixes above."""
+    t = text.lower()
+    if intended:
+        hit = lambda kw: partial_ratio_no_autojunk(kw.lower(), t) >= threshold
+    else:
+        hit = lambda kw: fuzz.partial_ratio(kw, t) >= threshold
+    issues = set()
+
+    if any(not has_negation_window(t, kw) and hit(kw) for kw in AIAnalysis.ISSUE_KEYWORDS["Damaged product"]):
+        severe = (any(mod in t for mod in AIAnalysis.SEVERE_MODS)
+                  or any(w in t for w in ["crack", "cracked", "shatter", "shattered", "chip", "chipped"]))
+        if not (original_rating.lower() == "positive" and not severe):
+            issues.add("Damaged product (severe)" if severe else "Damaged product")
+
+    for issue, kws in AIAnalysis.ISSUE_KEYWORDS.items():
+        if issue.startswith("Damaged product"):
+            continue
+        for kw in kws:
+            if has_negation_window(t, kw):
+                continue
+            if hit(kw):
+                issues.add(issue)
+                break
+
+    if "Accurate description" in issues and "Misleading description" in issues:
+        if re.search(r"\bmisleading\b|\bnot as described\b|\bdescription (?:not|isn't|isn’t) accurate\b", t):
+            issues.discard("Accurate description")
+        else:
+            issues.discard("Misleading description")
+
+    if any(pw in t for pw in AIAnalysis.POSITIVE_WORDS):
+        issues.add("Good product")
+    return sorted(issues)
+
+
+@pytest.mark.parametrize("path", DATASETS, ids=os.path.basename)
+def test_matches_legacy_rules_up_to_intended_fixes(path):
+    comments = pd.read_csv(path)["comment"].dropna().astype(str).str.strip().unique()
+    mismatches = [(c, r, AIAnalysis.match_issues_rule_based(c, r), legacy_match_issues(c, r, intended=True))
+                  for c in comments for r in RATINGS]
+    mismatches = [m for m in mismatches if m[2] != m[3]]
+    assert not mismatches, mismatches[:5]
+
+def test_capitalised_keywords_now_match():
+    assert "Fast delivery" not in legacy_match_issues("Prompt", "Positive")
+    assert "Fast delivery" in AIAnalysis.match_issues_rule_based("Prompt", "Positive")
+
+def test_long_comments_no_longer_hit_autojunk():
+    comment = ("The listing photos matched the item exactly and the seller answered every question I sent within "
+               "an hour. Packaging was sturdy, the battery holds a full charge and everything works as it should. "
+               "Highly recommended!")
+    assert len(comment) >= 200
+    assert "Good experience" not in legacy_match_issues(comment, "Positive")
+    assert "Good experience" in AIAnalysis.match_issues_rule_based(comment, "Positive")